@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Benchmark of the sun times computation (lib/astronomy.py) for many locations : one batch of sun_times()
+and a first polling cycle, where each location is set and then asked.
+The sun times are checked against published times by tests/test_astronomy.py.
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python benchmarks/bench_astronomy.py
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import argparse
+import random
+import time
+import timeit
+from datetime import date
+
+from domogik_packages.plugin_weather.lib.astronomy import Astronomy, sun_times
+
+
+def first_cycle(positions):
+    """ Set and ask the locations one after the other, like the first polling cycle does
+    """
+    sun = Astronomy()
+    for idx, (lat, lon) in enumerate(positions):
+        sun.set_location(str(idx), lat, lon, "7:00 am")
+        sun.get_sun(str(idx))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Sun times benchmark")
+    parser.add_argument("-n", "--locations", type = int, default = 10000, help = "number of locations")
+    args = parser.parse_args()
+
+    positions = [(random.uniform(-60, 60), random.uniform(-180, 180)) for idx in range(args.locations)]
+    day = date.today()
+    duration = min(timeit.repeat(lambda: sun_times(day, positions), number = 1, repeat = 3))
+    print("sun_times() batch : {0} locations in {1:.3f} seconds ({2:.1f} us/location)".format(args.locations, duration, duration / args.locations * 1e6))
+    start = time.time()
+    first_cycle(positions)
+    duration = time.time() - start
+    print("first cycle       : {0} locations in {1:.3f} seconds ({2:.1f} us/location)".format(args.locations, duration, duration / args.locations * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Micro benchmark of the extraction of the xPL values from the Yahoo weather data : the compiled
+extraction tables (lib/extraction.py) against the former hand written extraction.
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python benchmarks/bench_extraction.py
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import argparse
+import timeit
+
+from domogik_packages.plugin_weather.lib.extraction import compile_extraction_map, mph_to_kmh, fahrenheit_to_celcius
+from domogik_packages.plugin_weather.lib.fake_provider import make_channel
+
+
+def hand_written(cur, address, forecast_days):
+    """ The extraction as it was written before the extraction tables, limited to the same forecast days
+    """
+    values = [("pressure", cur['atmosphere']['pressure']),
+              ("humidity", cur['atmosphere']['humidity']),
+              ("last_updated", cur['lastBuildDate']),
+              ("current_station", "{0} ({1})".format(cur['location']['city'], cur['location']['country'])),
+              ("temp", fahrenheit_to_celcius(cur['item']['condition']['temp'])),
+              ("text", cur['item']['condition']['text']),
+              ("code", cur['item']['condition']['code']),
+              ("visibility", mph_to_kmh(cur['atmosphere']['visibility'])),
+              ("direction", cur['wind']['direction']),
+              ("speed", mph_to_kmh(cur['wind']['speed']))]
+    forecasts = []
+    day_num = 0
+    for day in cur['item']['forecast'][:forecast_days]:
+        forecasts.append({'day' : day_num,
+                          'device' : address,
+                          'day-name' : day['day'],
+                          'temperature-high' : fahrenheit_to_celcius(day['high']),
+                          'temperature-low' : fahrenheit_to_celcius(day['low']),
+                          'condition-text' : day['text'],
+                          'condition-code' : day['code']})
+        day_num += 1
+    return values, forecasts
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Extraction benchmark")
+    parser.add_argument("-n", "--devices", type = int, default = 1000, help = "number of devices")
+    args = parser.parse_args()
+
+    extraction = compile_extraction_map()
+    channels = [(str(1000000 + idx), make_channel(str(1000000 + idx))) for idx in range(args.devices)]
+
+    def run_hand_written():
+        for address, channel in channels:
+            hand_written(channel, address, extraction.forecast_days)
+
+    def run_tables():
+        for address, channel in channels:
+            extraction.extract_current(channel)
+            extraction.extract_forecasts(channel, address)
+
+    for name, function in (("hand written", run_hand_written),
+                           ("tables", run_tables)):
+        duration = min(timeit.repeat(function, number = 1, repeat = 5))
+        print("{0:<34} : {1:8.1f} us/device".format(name, duration / args.devices * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Micro benchmark of the butler forecast answer : the get_forecast object of a rivescript file is run
+like the butler does, with the compiled i18n data kept between the calls or rebuilt on each call.
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python benchmarks/bench_i18n.py
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+import timeit
+
+from domogik_packages.plugin_weather.lib import rs_weather
+
+RIVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rs", "{0}", "weather.rive")
+
+
+class StubBrain:
+    """ The rs object given to the rivescript objects
+    """
+
+    def __init__(self, devices):
+        self.log = logging.getLogger("bench")
+        self.devices = devices
+
+
+def load_object(locale, name):
+    """ Load a python object of a rivescript file, like rivescript does
+        @return the object function
+    """
+    with io.open(RIVE_FILE.format(locale), encoding = "utf-8") as fp:
+        lines = fp.read().split("\n")
+    start = lines.index(u"> object {0} python".format(name)) + 1
+    end = start
+    while not lines[end].startswith(u"< object"):
+        end += 1
+    code = u"def RSOBJ(rs, args):\n" + u"\n".join(lines[start:end]) + u"\n"
+    namespace = {}
+    exec(compile(code, "<{0}>".format(name), "exec"), namespace)
+    return namespace['RSOBJ']
+
+
+def make_devices():
+    """ A weather device with the forecast sensors, like in the butler memory
+    """
+    sensors = {}
+    for day in range(5):
+        for reference, value, data_type in (("temperature_high", 20, "DT_Temp"), ("temperature_low", 10, "DT_Temp"), ("condition_code", 30, "DT_String")):
+            reference = "forecast_{0}_{1}".format(day, reference)
+            sensors[reference] = {'reference' : reference, 'last_value' : value, 'data_type' : data_type}
+    sensors['current_temperature'] = {'reference' : "current_temperature", 'last_value' : 15, 'data_type' : "DT_Temp"}
+    return [{'name' : "Paris", 'sensors' : sensors}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Butler forecast i18n benchmark")
+    parser.add_argument("-l", "--locale", default = "fr_FR", help = "locale of the rivescript file")
+    parser.add_argument("-n", "--number", type = int, default = 2000, help = "number of requests")
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.CRITICAL)
+    get_forecast = load_object(args.locale, "get_forecast")
+    brain = StubBrain(make_devices())
+    requests = [["demain"], ["0"], ["lundi"]]
+
+    def ask():
+        for request in requests:
+            get_forecast(brain, request)
+
+    def ask_uncompiled():
+        for request in requests:
+            rs_weather.COMPILED_I18N.clear()
+            get_forecast(brain, request)
+
+    # the objects print some debug informations
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            uncompiled = min(timeit.repeat(ask_uncompiled, number = args.number, repeat = 3))
+            compiled = min(timeit.repeat(ask, number = args.number, repeat = 3))
+        finally:
+            sys.stdout = stdout
+
+    count = args.number * len(requests)
+    print("i18n rebuilt on each request : {0:8.1f} us/request".format(uncompiled / count * 1e6))
+    print("i18n compiled once           : {0:8.1f} us/request".format(compiled / count * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Micro benchmark of the index of the locations names used by the butler (lib/name_index.py) : time to
+build the index and time of a lookup, for spoken names with or without accents, with a typo and unknown.
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python benchmarks/bench_names.py -n 100,1000,5000
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import argparse
+import random
+import time
+import timeit
+
+from domogik_packages.plugin_weather.lib.name_index import NameIndex
+
+PREFIXES = [u"Saint-", u"Sainte-", u"Le ", u"La ", u"Mont-", u"Villeneuve-"] + [u""] * 14
+SYLLABLES = [u"bé", u"ri", u"mon", u"tar", u"gè", u"lu", u"vil", u"cha", u"teau", u"bour", u"san", u"nay",
+             u"ro", u"quê", u"fon", u"lan", u"ger", u"mar", u"sé", u"vo", u"plé", u"cour", u"ber", u"dun",
+             u"ac", u"ti", u"nè", u"pal", u"cros", u"lé", u"mé", u"ay", u"gou", u"cé", u"pin", u"vaux"]
+SUFFIXES = [u"-sur-Mer", u"-les-Bains", u"-en-Bresse", u"-la-Forêt"] + [u""] * 16
+
+
+def make_names(number, rnd):
+    """ Build some distinct locations names, like French towns names
+    """
+    names = []
+    seen = set()
+    while len(names) < number:
+        word = u"".join(rnd.choice(SYLLABLES) for idx in range(rnd.randint(2, 4)))
+        name = rnd.choice(PREFIXES) + word.capitalize() + rnd.choice(SUFFIXES)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def spoken(name):
+    """ The name as the butler gets it : lowercased, without accents and punctuation
+    """
+    return name.lower().replace(u"-", u" ").replace(u"é", u"e").replace(u"è", u"e").replace(u"ê", u"e")
+
+
+def typo(name):
+    """ The spoken name with a missing letter
+    """
+    words = spoken(name)
+    pos = len(words) // 2
+    return words[:pos] + words[pos+1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Locations names index benchmark")
+    parser.add_argument("-n", "--names", default = "100,1000,5000", help = "comma separated numbers of locations")
+    parser.add_argument("-l", "--lookups", type = int, default = 500, help = "number of lookups of each kind")
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    print("{0:>6} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10} {6:>8}".format(
+          "names", "build ms", "exact us", "spoken us", "typo us", "unknown us", "typo ok"))
+    for number in [int(value) for value in args.names.split(",")]:
+        names = make_names(number, rnd)
+        start = time.time()
+        index = NameIndex(names)
+        build = time.time() - start
+
+        sample = [rnd.choice(names) for idx in range(args.lookups)]
+        kinds = [("exact", sample),
+                 ("spoken", [spoken(name) for name in sample]),
+                 ("typo", [typo(name) for name in sample]),
+                 ("unknown", [u"ville inconnue {0}".format(idx) for idx in range(args.lookups)])]
+        durations = []
+        for kind, queries in kinds:
+            def lookup():
+                for query in queries:
+                    index.match(query)
+            durations.append(min(timeit.repeat(lookup, number = 1, repeat = 3)) / len(queries) * 1e6)
+        typo_ok = len([name for name in sample if index.match(typo(name))[0] == name])
+        print("{0:>6} {1:>10.1f} {2:>10.1f} {3:>10.1f} {4:>10.1f} {5:>10.1f} {6:>7.0f}%".format(
+              number, build * 1e3, durations[0], durations[1], durations[2], durations[3], 100.0 * typo_ok / len(sample)))
+
+
+if __name__ == "__main__":
+    main()
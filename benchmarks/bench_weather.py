@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+End to end benchmark of the weather polling : Weather.get_weather() is run against a local fake
+provider, with stub xPL callbacks.
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python benchmarks/bench_weather.py -n 1,100,1000,10000
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import argparse
+import logging
+import resource
+import threading
+import time
+
+from domogik_packages.plugin_weather.lib.weather import Weather
+from domogik_packages.plugin_weather.lib.fake_provider import FakeProvider
+
+FIRST_WOEID = 1000000
+
+
+class Timings:
+    """ Cumulated time of each step, for all the threads
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.fetch = 0.0
+        self.decode = 0.0
+        self.publish = 0.0
+        self.messages = 0
+
+    def add(self, step, duration):
+        with self._lock:
+            setattr(self, step, getattr(self, step) + duration)
+
+
+class BenchWeather(Weather):
+    """ Weather object which measures the time spent in each step
+    """
+
+    def __init__(self, timings, *args, **kwargs):
+        Weather.__init__(self, *args, **kwargs)
+        self._timings = timings
+        # fetch time of the current request, for each fetching thread
+        self._last_fetch = threading.local()
+        http_get = self._http.get
+
+        def timed_get(url):
+            start = time.time()
+            try:
+                return http_get(url)
+            finally:
+                self._last_fetch.duration = time.time() - start
+                timings.add("fetch", self._last_fetch.duration)
+        self._http.get = timed_get
+
+    def _call_yahoo(self, query, addresses):
+        # the decode time is the time of the call minus the fetch time
+        self._last_fetch.duration = 0.0
+        start = time.time()
+        data = Weather._call_yahoo(self, query, addresses)
+        self._timings.add("decode", time.time() - start - self._last_fetch.duration)
+        return data
+
+    def _send(self, address, data):
+        start = time.time()
+        try:
+            return Weather._send(self, address, data)
+        finally:
+            self._timings.add("publish", time.time() - start)
+
+
+def get_peak_memory():
+    """ Return the peak memory of the process (in MB)
+    """
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(num_devices, args, provider):
+    """ Run the benchmark cycles for a number of devices
+    """
+    timings = Timings()
+    log = logging.getLogger("bench")
+
+    def callback_sensor_basic(device, w_type, value):
+        timings.messages += 1
+
+    def callback_weather_forecast(data):
+        timings.messages += 1
+
+    def get_parameter_for_feature(device, xpl_type, feature, key):
+        return device['address']
+
+    devices = [{'name' : "City {0}".format(idx), 'address' : str(FIRST_WOEID + idx)} for idx in range(num_devices)]
+    weather = BenchWeather(timings,
+                           log,
+                           callback_sensor_basic,
+                           callback_weather_forecast,
+                           threading.Event(),
+                           get_parameter_for_feature,
+                           max_concurrency = args.concurrency,
+                           batch_size = args.batch_size,
+                           url = provider.get_url(),
+                           shards = args.shards)
+
+    results = []
+    weather.start_shards()
+    try:
+        for cycle in range(args.cycles):
+            timings.reset()
+            requests_before = provider.requests
+            start = time.time()
+            weather.get_weather(devices)
+            wall = time.time() - start
+            results.append((wall, timings.fetch, timings.decode, timings.publish, timings.messages, provider.requests - requests_before))
+    finally:
+        weather.stop_shards()
+
+    # keep the best cycle
+    wall, fetch, decode, publish, messages, requests = min(results)
+    print("{0:>8} {1:>10.3f} {2:>10.3f} {3:>10.3f} {4:>10.3f} {5:>10} {6:>9} {7:>10.1f}".format(
+          num_devices, wall, fetch, decode, publish, messages, requests, get_peak_memory()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Weather polling benchmark")
+    parser.add_argument("-n", "--devices", default = "1,100,1000,10000", help = "comma separated list of numbers of devices")
+    parser.add_argument("-c", "--cycles", type = int, default = 3, help = "number of cycles for each number of devices (the best is kept)")
+    parser.add_argument("--concurrency", type = int, default = 4, help = "max_concurrency option")
+    parser.add_argument("--batch-size", type = int, default = 1, help = "batch_size option")
+    parser.add_argument("--latency", type = float, default = 0, help = "average latency of the fake provider (seconds)")
+    parser.add_argument("--error-rate", type = float, default = 0, help = "ratio of requests in error on the fake provider")
+    parser.add_argument("--padding", type = int, default = 0, help = "extra bytes in each location data")
+    parser.add_argument("--shards", type = int, default = 0, help = "shards option (fetch and decode are then not measured)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.CRITICAL)
+    provider = FakeProvider(latency = args.latency, error_rate = args.error_rate, padding = args.padding)
+    provider.start()
+    try:
+        print("Times in seconds. fetch, decode and publish are cumulated over the fetching threads. Peak memory in MB.")
+        print("{0:>8} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10} {6:>9} {7:>10}".format(
+              "devices", "cycle", "fetch", "decode", "publish", "messages", "requests", "peak mem"))
+        for num_devices in args.devices.split(","):
+            run(int(num_devices), args, provider)
+    finally:
+        provider.stop()
+
+
+if __name__ == "__main__":
+    main()
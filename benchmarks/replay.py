@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Replay the Yahoo weather responses recorded by the plugin (record_responses option) through the
+decode and publish code, with stub xPL callbacks.
+With --dump, the xPL messages are printed : the outputs of 2 versions of the plugin can be compared.
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python benchmarks/replay.py responses-20161018-101500.rec
+    export PYTHONPATH=/var/lib/domogik && python benchmarks/replay.py responses-20161018-101500-shard*.rec
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import argparse
+import logging
+import threading
+import time
+
+from domogik_packages.plugin_weather.lib.weather import Weather
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Replay recorded Yahoo weather responses")
+    parser.add_argument("filenames", nargs = "+", help = "records files (all the files of the shards in sharded mode)")
+    parser.add_argument("-s", "--speed", type = float, default = 0, help = "1 = at the speed of the recording, 0 = as fast as possible")
+    parser.add_argument("--dump", action = "store_true", help = "print the xPL messages")
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.CRITICAL)
+    counts = {'messages' : 0}
+
+    def callback_sensor_basic(device, w_type, value):
+        counts['messages'] += 1
+        if args.dump:
+            print(u"sensor.basic device={0} type={1} current={2}".format(device, w_type, value))
+
+    def callback_weather_forecast(data):
+        counts['messages'] += 1
+        if args.dump:
+            print(u"weather.forecast {0}".format(u" ".join(u"{0}={1}".format(key, data[key]) for key in sorted(data))))
+
+    weather = Weather(logging.getLogger("replay"),
+                      callback_sensor_basic,
+                      callback_weather_forecast,
+                      threading.Event(),
+                      None)
+    start = time.time()
+    num_records = weather.replay(args.filenames, speed = args.speed)
+    duration = time.time() - start
+    if not args.dump:
+        print("{0} responses replayed in {1:.3f} seconds ({2:.0f} responses/s), {3} messages".format(
+              num_records, duration, num_records / max(duration, 1e-9), counts['messages']))
+
+
+if __name__ == "__main__":
+    main()
@@ -39,8 +39,14 @@ from domogik.xpl.common.xplmessage import XplMessage
 from domogik.xpl.common.plugin import XplPlugin
 
 from domogik_packages.plugin_weather.lib.weather import Weather
+from domogik_packages.plugin_weather.lib.publisher import BatchPublisher
+from domogik_packages.plugin_weather.lib.scheduler import parse_interval_overrides
+from domogik_packages.plugin_weather.lib.metrics import Metrics
+from domogik_packages.plugin_weather.lib.changes import ChangeFilter, check_heartbeat
 #from domogik_packages.plugin_weather.lib.weather import WeatherException
+import os
 import threading
+import time
 import traceback
 
 
@@ -61,12 +67,58 @@ class WeatherManager(XplPlugin):
         # for this plugin, if no devices are created we won't be able to use devices.
         self.devices = self.get_device_list(quit_if_no_device = True)
 
+        # get the config values
+        max_concurrency = self.get_config("max_concurrency")
+        timeout = self.get_config("timeout")
+        batch_size = self.get_config("batch_size")
+        connect_timeout = self.get_config("connect_timeout")
+        max_response_size = self.get_config("max_response_size")
+        cache_ttl = self.get_config("cache_ttl")
+        cache_max_size = self.get_config("cache_max_size")
+        cache_directory = os.path.join(self.get_data_files_directory(), "cache")
+        interval_overrides = parse_interval_overrides(self.get_config("interval_overrides"))
+        self.publish_only_changes = self.get_config("publish_only_changes")
+        heartbeat = check_heartbeat(self.log, self.get_config("heartbeat") * 60)
+        if self.get_config("record_responses"):
+            record_filename = os.path.join(self.get_data_files_directory(), "records", "responses-{0}.rec".format(time.strftime("%Y%m%d-%H%M%S")))
+        else:
+            record_filename = None
+
+        # last value sent for each (device, type)
+        self._changes = ChangeFilter(heartbeat)
+
+        # the messages of a device are queued and sent in one burst, with a rate limit
+        self._publisher = BatchPublisher(self.log, self.myxpl.send, self.get_stop(), max_rate = self.get_config("max_send_rate"))
+
+        # timings and counters, dumped in a json file
+        self.metrics = Metrics(self.log,
+                               filename = os.path.join(self.get_data_files_directory(), "metrics.json"),
+                               dump_interval = self.get_config("stats_interval") * 60)
+        self.metrics.register_gauge("xpl", self._publisher.get_stats)
 
         self.weather_manager = Weather(self.log, 
                                        self.send_xpl_sensor_basic, 
                                        self.send_xpl_weather_forecast, 
                                        self.get_stop(), 
-                                       self.get_parameter_for_feature)
+                                       self.get_parameter_for_feature,
+                                       max_concurrency = max_concurrency,
+                                       timeout = timeout,
+                                       batch_size = batch_size,
+                                       connect_timeout = connect_timeout,
+                                       max_response_size = max_response_size,
+                                       cache_directory = cache_directory,
+                                       cache_ttl = cache_ttl,
+                                       cache_max_size = cache_max_size,
+                                       callback_flush = self.flush_xpl,
+                                       interval_overrides = interval_overrides,
+                                       metrics = self.metrics,
+                                       profile_every = self.get_config("profile_every"),
+                                       profile_directory = os.path.join(self.get_data_files_directory(), "profiles"),
+                                       history_size = self.get_config("history_size"),
+                                       trend_window = self.get_config("trend_window"),
+                                       max_staleness = self.get_config("max_staleness"),
+                                       shards = self.get_config("shards"),
+                                       record_filename = record_filename)
         # Start getting weather informations
         weather_process = threading.Thread(None,
                                     self.weather_manager.start_loop,
@@ -76,22 +128,42 @@ class WeatherManager(XplPlugin):
         self.register_thread(weather_process)
         weather_process.start()
 
+        # the devices created, updated or deleted while the plugin is running are applied without a restart
+        self.register_cb_update_devices(self.reload_devices)
+
         self.ready()
 
+    def reload_devices(self, devices):
+        """ Called by Domogik when the devices list changes
+        """
+        self.devices = devices
+        added, removed = self.weather_manager.update_devices(devices)
+        # forget the last values of the removed locations
+        self._changes.forget(removed)
+
     def send_xpl_sensor_basic(self, w_device, w_type, w_value):
         """ Send xPL message on network
         """
         self.log.debug(u"Values for {0} on {1} : {2}".format(w_device, w_type, w_value))
         if w_value == "" or w_value is None:
             self.log.warning(u"Empty value for {0} on {1}. The xPL message will not be sent".format(w_device, w_type))
+            self.metrics.incr("xpl_empty_values")
             return
+        # an unchanged value is sent again only when the heartbeat delay is over, so the sensor timeout is never reached
+        on_sent = None
+        if self.publish_only_changes:
+            if self._changes.is_unchanged(w_device, w_type, w_value):
+                self.log.debug(u"Unchanged value for {0} on {1}. The xPL message will not be sent".format(w_device, w_type))
+                self.metrics.incr("xpl_unchanged_values")
+                return
+            on_sent = lambda: self._changes.sent(w_device, w_type, w_value)
         msg = XplMessage()
         msg.set_type("xpl-stat")
         msg.set_schema("sensor.basic")
         msg.add_data({"device" : w_device})
         msg.add_data({"type" : w_type})
         msg.add_data({"current" : w_value})
-        self.myxpl.send(msg)
+        self._publisher.queue(msg, on_sent)
 
     def send_xpl_weather_forecast(self, data):
         """ Send xPL message on network
@@ -105,7 +177,14 @@ class WeatherManager(XplPlugin):
             val = data[key]
             if val != "":
                 msg.add_data({key : val})
-        self.myxpl.send(msg)
+        self._publisher.queue(msg)
+
+    def flush_xpl(self, w_device):
+        """ Send the queued xPL messages of a device
+        """
+        start = time.time()
+        self._publisher.flush()
+        self.metrics.record("xpl_flush_time", time.time() - start)
 
 if __name__ == "__main__":
     WeatherManager()
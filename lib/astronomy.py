@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Sunrise, sunset, day length and solar elevation of the locations, computed with the NOAA
+solar calculator equations (https://www.esrl.noaa.gov/gmd/grad/solcalc/calcdetails.html)
+
+Implements
+==========
+
+- sun_times
+- solar_elevation
+- Astronomy
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+# zenith of the sun at sunrise and sunset : refraction and sun radius included
+SUNRISE_ZENITH = 90.833 # degrees
+# the learned UTC offsets are rounded to this (in minutes)
+UTC_OFFSET_STEP = 15
+# number of dates kept in the cache (the local dates of the locations differ by up to 2 days)
+CACHED_DATES = 3
+
+
+def _solar_terms(when):
+    """ Return the sun declination (in degrees) and the equation of time (in minutes) at a time
+        @param when : UTC datetime
+    """
+    # fractional year (in radians)
+    day_of_year = when.timetuple().tm_yday
+    gamma = 2 * math.pi / 365 * (day_of_year - 1 + (when.hour - 12 + when.minute / 60.0) / 24)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+                       - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma)
+            - 0.006758 * math.cos(2 * gamma) + 0.000907 * math.sin(2 * gamma)
+            - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+    return math.degrees(decl), eqtime
+
+
+def sun_times(date, positions):
+    """ Compute the sunrise and sunset of several locations for a date.
+        The sun terms only depend on the date, so they are computed once for all the locations.
+        @param date : a date
+        @param positions : list of (latitude, longitude) in degrees, east and north positive
+        @return a list of (sunrise, sunset) in minutes from the date midnight UTC (may be negative or over 1440).
+                (None, None) during the polar night, (None, 0) during the polar day
+    """
+    decl, eqtime = _solar_terms(datetime(date.year, date.month, date.day, 12))
+    cos_zenith = math.cos(math.radians(SUNRISE_ZENITH))
+    sin_decl = math.sin(math.radians(decl))
+    cos_decl = math.cos(math.radians(decl))
+    results = []
+    for lat, lon in positions:
+        rlat = math.radians(lat)
+        cos_ha = (cos_zenith - math.sin(rlat) * sin_decl) / (math.cos(rlat) * cos_decl)
+        if cos_ha > 1:
+            results.append((None, None))
+            continue
+        if cos_ha < -1:
+            results.append((None, 0))
+            continue
+        hour_angle = math.degrees(math.acos(cos_ha))
+        noon = 720 - 4 * lon - eqtime
+        results.append((noon - 4 * hour_angle, noon + 4 * hour_angle))
+    return results
+
+
+def solar_elevation(when, lat, lon):
+    """ Compute the elevation of the sun above the horizon (refraction not included)
+        @param when : UTC datetime
+        @param lat : latitude in degrees
+        @param lon : longitude in degrees
+        @return the elevation in degrees
+    """
+    decl, eqtime = _solar_terms(when)
+    true_solar_time = when.hour * 60 + when.minute + when.second / 60.0 + eqtime + 4 * lon
+    hour_angle = math.radians(true_solar_time / 4 - 180)
+    rlat = math.radians(lat)
+    rdecl = math.radians(decl)
+    cos_zenith = math.sin(rlat) * math.sin(rdecl) + math.cos(rlat) * math.cos(rdecl) * math.cos(hour_angle)
+    return 90 - math.degrees(math.acos(max(-1.0, min(1.0, cos_zenith))))
+
+
+def format_minutes(minutes):
+    """ Format minutes from midnight as HH:MM:SS
+    """
+    seconds = int(round(minutes * 60)) % 86400
+    return "{0:02d}:{1:02d}:{2:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Astronomy:
+    """ Sun informations of the locations.
+        The position of a location is given by the provider data. Its UTC offset is learned by comparing the
+        provider sunrise (local time) with the computed one. The sun times of all the locations are computed
+        in one batch for each date and kept until the next dates, so they are still available when the
+        provider is down.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # address => [latitude, longitude, UTC offset in minutes or None, UTC date of the offset]
+        self._locations = {}
+        # date => {address : (sunrise, sunset)} in minutes UTC
+        self._cache = {}
+
+    def set_location(self, address, lat, lon, provider_sunrise = None):
+        """ Set the position of a location and learn its UTC offset
+            @param address : the location code
+            @param lat : latitude in degrees
+            @param lon : longitude in degrees
+            @param provider_sunrise : the local sunrise time given by the provider, like '7:35 am'
+        """
+        with self._lock:
+            location = self._locations.get(address)
+            if location is None or location[0] != lat or location[1] != lon:
+                location = [lat, lon, None, None]
+                self._locations[address] = location
+                for date in self._cache:
+                    self._cache[date].pop(address, None)
+        # the offset is learned once a day (for the daylight saving time changes)
+        today = datetime.utcnow().date()
+        if provider_sunrise is None or location[3] == today:
+            return
+        try:
+            local = time.strptime(provider_sunrise, "%I:%M %p")
+        except ValueError:
+            return
+        sunrise = sun_times(today, [(lat, lon)])[0][0]
+        if sunrise is None:
+            return
+        offset = local.tm_hour * 60 + local.tm_min - sunrise
+        # the offset is between -12 and +14 hours
+        offset = (offset + 720) % 1440 - 720
+        if offset < -600:
+            offset += 1440
+        location[2] = int(round(offset / UTC_OFFSET_STEP)) * UTC_OFFSET_STEP
+        location[3] = today
+
+    def remove(self, address):
+        """ Forget a location
+        """
+        with self._lock:
+            self._locations.pop(address, None)
+
+    def get_sun(self, address, now = None):
+        """ Return the sun informations of a location for its current local date
+            @param address : the location code
+            @param now : UTC datetime. None = now
+            @return None if the location position or UTC offset is unknown, else a dict with :
+                    sunrise, sunset : local times as HH:MM:SS (None during the polar day or night)
+                    day_length : in minutes
+                    elevation : current solar elevation in degrees
+        """
+        if now is None:
+            now = datetime.utcnow()
+        with self._lock:
+            location = self._locations.get(address)
+            if location is None or location[2] is None:
+                return None
+            lat, lon, offset = location[:3]
+            date = (now + timedelta(minutes = offset)).date()
+            sunrise, sunset = self._get_times(date, address)
+        result = {'elevation' : solar_elevation(now, lat, lon)}
+        if sunrise is None:
+            result['sunrise'] = result['sunset'] = None
+            result['day_length'] = 0 if sunset is None else 1440
+        else:
+            result['sunrise'] = format_minutes(sunrise + offset)
+            result['sunset'] = format_minutes(sunset + offset)
+            result['day_length'] = int(round(sunset - sunrise))
+        return result
+
+    def _get_times(self, date, address):
+        """ Return the (sunrise, sunset) of a location. For a new date, all the known locations are computed in
+            one batch. A location added or moved later is computed alone and added to the date.
+            The lock must be held
+        """
+        times = self._cache.get(date)
+        if times is None:
+            addresses = list(self._locations)
+            results = sun_times(date, [self._locations[an_address][:2] for an_address in addresses])
+            times = dict(zip(addresses, results))
+            self._cache[date] = times
+            for old_date in sorted(self._cache)[:-CACHED_DATES]:
+                del self._cache[old_date]
+        elif address not in times:
+            times[address] = sun_times(date, [self._locations[address][:2]])[0]
+        return times[address]
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+On disk cache of the weather provider responses
+
+Implements
+==========
+
+- ResponseCache
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_FILE_SUFFIX = ".json"
+
+
+class ResponseCache:
+    """ Keep the last data of each location on disk (one file per location).
+        The files are written atomically, so a crash never leaves a partial entry.
+        When the total size is over the limit, the oldest entries are removed first : the index is kept in the
+        order of the writes (an entry written again goes to the end) with the total size, so the eviction
+        does not go through all the entries.
+    """
+
+    def __init__(self, log, directory, ttl, max_size):
+        """ Init the cache
+            @param log : log instance
+            @param directory : the cache directory. It is created if needed
+            @param ttl : time (in seconds) during which an entry is fresh
+            @param max_size : maximum total size (in bytes) of the cache files
+        """
+        self.log = log
+        self._directory = directory
+        self.ttl = ttl
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        # address => (timestamp, size), from the oldest to the newest entry
+        self._index = OrderedDict()
+        # total size of the entries
+        self._total = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._load_index()
+
+    def get(self, address, max_age = None):
+        """ Get a cached response
+            @param address : the location code (woeid)
+            @param max_age : maximum age (in seconds) of the entry. None = no limit
+            @return (timestamp, data) or None if there is no such entry
+        """
+        with self._lock:
+            if address not in self._index:
+                return None
+            if max_age is not None and time.time() - self._index[address][0] > max_age:
+                return None
+        try:
+            with open(self._filename(address)) as fp:
+                entry = json.load(fp)
+            return entry['timestamp'], entry['data']
+        except (IOError, OSError, ValueError, KeyError):
+            self.log.warning(u"Unable to read the cache entry for {0}. It is removed".format(address))
+            self.remove(address)
+            return None
+
+    def is_fresh(self, address):
+        """ Tell if the entry of a location is younger than the ttl
+        """
+        with self._lock:
+            return address in self._index and time.time() - self._index[address][0] <= self.ttl
+
+    def addresses(self):
+        """ Return the addresses of all the cached locations
+        """
+        with self._lock:
+            return list(self._index.keys())
+
+    def put(self, address, data):
+        """ Store the response of a location
+            @param address : the location code (woeid)
+            @param data : the data of the location (json serializable)
+        """
+        now = time.time()
+        content = json.dumps({'address' : address, 'timestamp' : now, 'data' : data})
+        # write in a temporary file, then rename it : the rename is atomic
+        fd, tmp_filename = tempfile.mkstemp(suffix = ".tmp", dir = self._directory)
+        try:
+            with os.fdopen(fd, "w") as fp:
+                fp.write(content)
+            os.rename(tmp_filename, self._filename(address))
+        except:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+        with self._lock:
+            self._forget(address)
+            self._index[address] = (now, len(content))
+            self._total += len(content)
+        self._evict()
+
+    def remove(self, address):
+        """ Remove the entry of a location
+        """
+        with self._lock:
+            self._forget(address)
+        try:
+            os.remove(self._filename(address))
+        except OSError:
+            pass
+
+    def _forget(self, address):
+        """ Remove a location from the index. The lock must be held
+        """
+        entry = self._index.pop(address, None)
+        if entry is not None:
+            self._total -= entry[1]
+
+    def _evict(self):
+        """ Remove the oldest entries until the total size is under the limit
+        """
+        evicted = []
+        with self._lock:
+            while self._total > self._max_size and len(self._index) > 0:
+                address, (timestamp, size) = self._index.popitem(last = False)
+                self._total -= size
+                evicted.append(address)
+        for address in evicted:
+            self.log.debug(u"Cache is full : remove the entry for {0}".format(address))
+            try:
+                os.remove(self._filename(address))
+            except OSError:
+                pass
+
+    def _load_index(self):
+        """ Build the index from the files found in the cache directory
+        """
+        entries = []
+        for filename in os.listdir(self._directory):
+            full_filename = os.path.join(self._directory, filename)
+            if filename.endswith(".tmp"):
+                # a temporary file from an interrupted write
+                os.remove(full_filename)
+                continue
+            if not filename.endswith(CACHE_FILE_SUFFIX):
+                continue
+            try:
+                with open(full_filename) as fp:
+                    entry = json.load(fp)
+                entries.append((entry['timestamp'], entry['address'], os.path.getsize(full_filename)))
+            except (IOError, OSError, ValueError, KeyError):
+                self.log.warning(u"Invalid cache file {0}. It is removed".format(full_filename))
+                os.remove(full_filename)
+        for timestamp, address, size in sorted(entries):
+            self._forget(address)
+            self._index[address] = (timestamp, size)
+            self._total += size
+        self.log.info(u"{0} locations found in the cache".format(len(self._index)))
+        self._evict()
+
+    def _filename(self, address):
+        """ Return the cache file of a location
+        """
+        return os.path.join(self._directory, re.sub(r"[^\w-]", "_", address) + CACHE_FILE_SUFFIX)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Send the current values only when they change, or again after the heartbeat delay
+
+Implements
+==========
+
+- ChangeFilter
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import io
+import json
+import threading
+import time
+
+from domogik_packages.plugin_weather.lib.extraction import INFO_FILE
+from domogik_packages.plugin_weather.lib.weather import MAX_INTERVAL
+
+
+def get_sensor_timeout(info_file = INFO_FILE):
+    """ Return the smallest timeout (in seconds) of the sensors declared in info.json, or None if no sensor has a timeout
+    """
+    with io.open(info_file, encoding = "utf-8") as fp:
+        sensors = json.load(fp)['sensors']
+    timeouts = [sensor['timeout'] for sensor in sensors.values() if sensor.get('timeout', 0) > 0]
+    if len(timeouts) == 0:
+        return None
+    return min(timeouts)
+
+
+def check_heartbeat(log, heartbeat, info_file = INFO_FILE):
+    """ Check the heartbeat against the sensors timeout. An unchanged value is sent again on the first poll after
+        the heartbeat delay, so up to MAX_INTERVAL later : it must still be before the sensor timeout
+        @param heartbeat : the heartbeat delay (in seconds)
+        @return the heartbeat delay to use (in seconds)
+    """
+    timeout = get_sensor_timeout(info_file)
+    if timeout is None:
+        return heartbeat
+    max_heartbeat = max(timeout - MAX_INTERVAL * 60, 0)
+    if heartbeat > max_heartbeat:
+        log.warning(u"The heartbeat ({0} minutes) is too long for the sensors timeout ({1} minutes) : {2} minutes will be used".format(heartbeat // 60, timeout // 60, max_heartbeat // 60))
+        return max_heartbeat
+    return heartbeat
+
+
+class ChangeFilter:
+    """ Last value sent for each (device, type). A value is recorded only when its xPL message is really sent
+        (see BatchPublisher.queue()) : a message dropped by the publisher does not suppress the next ones.
+        The values are recorded from the polling thread and forgotten from the devices update thread.
+    """
+
+    def __init__(self, heartbeat):
+        """ Init the filter
+            @param heartbeat : delay (in seconds) after which an unchanged value is sent again
+        """
+        self._heartbeat = heartbeat
+        self._lock = threading.Lock()
+        # (device, type) => (value, timestamp)
+        self._last_sent = {}
+
+    def is_unchanged(self, device, w_type, value, now = None):
+        """ Return True if the value was already sent less than the heartbeat delay ago
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            last = self._last_sent.get((device, w_type))
+        return last is not None and last[0] == value and now - last[1] < self._heartbeat
+
+    def sent(self, device, w_type, value, now = None):
+        """ Record a value which was sent
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._last_sent[(device, w_type)] = (value, now)
+
+    def forget(self, devices):
+        """ Forget the values of some devices
+            @param devices : the devices (xPL device parameter) to forget
+        """
+        with self._lock:
+            for key in list(self._last_sent):
+                if key[0] in devices:
+                    del self._last_sent[key]
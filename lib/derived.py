@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Values computed from the observations of all the locations of a polling cycle :
+dew point, heat index, wind chill and feels like temperature
+
+Implements
+==========
+
+- DerivedMetrics
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import math
+import threading
+from array import array
+
+NAN = float("nan")
+
+# Magnus formula coefficients for the dew point
+MAGNUS_A = 17.62
+MAGNUS_B = 243.12 # °C
+# the heat index is used above this temperature
+HEAT_INDEX_MIN_TEMP = 26.7 # °C (80 °F)
+# the wind chill is used below this temperature and above this wind speed
+WIND_CHILL_MAX_TEMP = 10.0 # °C
+WIND_CHILL_MIN_SPEED = 4.8 # km/h
+
+
+def _heat_index_f(temp_f, humidity):
+    """ NWS heat index (Rothfusz regression with its adjustments), in °F
+    """
+    simple = 0.5 * (temp_f + 61.0 + (temp_f - 68.0) * 1.2 + humidity * 0.094)
+    if (simple + temp_f) / 2 < 80:
+        return simple
+    index = (-42.379 + 2.04901523 * temp_f + 10.14333127 * humidity - 0.22475541 * temp_f * humidity
+             - 0.00683783 * temp_f * temp_f - 0.05481717 * humidity * humidity
+             + 0.00122874 * temp_f * temp_f * humidity + 0.00085282 * temp_f * humidity * humidity
+             - 0.00000199 * temp_f * temp_f * humidity * humidity)
+    if humidity < 13 and 80 <= temp_f <= 112:
+        index -= (13 - humidity) / 4 * math.sqrt((17 - abs(temp_f - 95)) / 17)
+    elif humidity > 85 and 80 <= temp_f <= 87:
+        index += (humidity - 85) / 10 * (87 - temp_f) / 5
+    return index
+
+
+class DerivedMetrics:
+    """ Collect the observations of the locations during a polling cycle in columns (arrays of doubles),
+        then compute the derived values of all the locations in one pass.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        # address => row in the columns
+        self._rows = {}
+        self._addresses = []
+        self._temp_f = array("d")
+        self._humidity = array("d")
+        self._wind_speed = array("d")
+
+    def add(self, address, temp_f, humidity, wind_speed):
+        """ Add the observation of a location. A second observation of the same location replaces the first one
+            @param address : the location code
+            @param temp_f : temperature in °F
+            @param humidity : relative humidity in %
+            @param wind_speed : wind speed in km/h
+            A missing value is given as NaN
+        """
+        with self._lock:
+            row = self._rows.get(address)
+            if row is None:
+                self._rows[address] = len(self._addresses)
+                self._addresses.append(address)
+                self._temp_f.append(temp_f)
+                self._humidity.append(humidity)
+                self._wind_speed.append(wind_speed)
+            else:
+                self._temp_f[row] = temp_f
+                self._humidity[row] = humidity
+                self._wind_speed[row] = wind_speed
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def compute(self):
+        """ Compute the derived values of the collected observations and start a new collection
+            @return a list of (address, dict sensor type => value in °C). A value which can't be computed is NaN
+        """
+        with self._lock:
+            addresses, temps_f, humidities, wind_speeds = self._addresses, self._temp_f, self._humidity, self._wind_speed
+            self._clear()
+
+        num = len(addresses)
+        temps = array("d", [(temp_f - 32) / 1.8 for temp_f in temps_f])
+        dewpoints = array("d", [NAN]) * num
+        heat_indexes = array("d", [NAN]) * num
+        wind_chills = array("d", [NAN]) * num
+        feels_like = array("d", [NAN]) * num
+        log = math.log
+        isnan = math.isnan
+        for idx in range(num):
+            temp = temps[idx]
+            humidity = humidities[idx]
+            speed = wind_speeds[idx]
+            if isnan(temp):
+                continue
+            if humidity > 0:
+                gamma = log(humidity / 100.0) + MAGNUS_A * temp / (MAGNUS_B + temp)
+                dewpoints[idx] = MAGNUS_B * gamma / (MAGNUS_A - gamma)
+            # out of their range, the heat index and the wind chill are the temperature
+            if temp < HEAT_INDEX_MIN_TEMP:
+                heat_indexes[idx] = temp
+            elif humidity > 0:
+                heat_indexes[idx] = (_heat_index_f(temps_f[idx], humidity) - 32) / 1.8
+            if speed > WIND_CHILL_MIN_SPEED and temp <= WIND_CHILL_MAX_TEMP:
+                factor = speed ** 0.16
+                wind_chills[idx] = 13.12 + 0.6215 * temp - 11.37 * factor + 0.3965 * temp * factor
+            else:
+                wind_chills[idx] = temp
+            if temp >= HEAT_INDEX_MIN_TEMP and not isnan(heat_indexes[idx]):
+                feels_like[idx] = heat_indexes[idx]
+            else:
+                feels_like[idx] = wind_chills[idx]
+
+        return [(addresses[idx], {'temp_dewpoint' : dewpoints[idx],
+                                  'temp_heat_index' : heat_indexes[idx],
+                                  'temp_wind_chill' : wind_chills[idx],
+                                  'temp_feels_like' : feels_like[idx]}) for idx in range(num)]
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Extraction of the xPL values from the Yahoo weather data. The tables below give the place of each
+sensor value in the Yahoo weather data. They are compiled with the xpl_stats of info.json, which give
+the xPL type of each sensor and the forecast days.
+
+Implements
+==========
+
+- ExtractionMap
+- compile_extraction_map
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import json
+import io
+import os
+
+INFO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "info.json")
+
+
+def mph_to_kmh(s):
+    # yahoo return some values in mph but in fact they are in km/h... so I commented the conversion
+    #return float(s)/1.6093
+    return float(s)
+
+def fahrenheit_to_celcius(f):
+    return "{0:.0f}".format((float(f)-32)/1.8)
+
+def station(city, country):
+    return "{0} ({1})".format(city, country)
+
+
+# sensor => (paths of the values in the channel data, conversion of the values)
+CURRENT_FIELDS = {
+    # 04/2016 : dirty fix to fix yahoo issues in celcius...
+    # yahoo convert 1013 inHg to milibar for example but 1013 is already in milibar
+    # so nothing to convert :)
+    "current_barometer_value" : ([("atmosphere", "pressure")], None),
+    "current_humidity" : ([("atmosphere", "humidity")], None),
+    "current_last_updated" : ([("lastBuildDate",)], None),
+    "current_station" : ([("location", "city"), ("location", "country")], station),
+    # yahoo give the value in °F instead of °C
+    "current_temperature" : ([("item", "condition", "temp")], fahrenheit_to_celcius),
+    "current_text" : ([("item", "condition", "text")], None),
+    "current_code" : ([("item", "condition", "code")], None),
+    "current_visibility" : ([("atmosphere", "visibility")], mph_to_kmh),
+    "current_wind_direction" : ([("wind", "direction")], None),
+    "current_wind_speed" : ([("wind", "speed")], mph_to_kmh),
+    # yahoo weather # N/A : current_moon_phase, current_uv, current_wind_gust, current_wind_text
+}
+
+# weather.forecast key => (field of a day of the forecast data, conversion of the value)
+FORECAST_FIELDS = {
+    "day-name" : ("day", None),
+    "temperature-high" : ("high", fahrenheit_to_celcius),
+    "temperature-low" : ("low", fahrenheit_to_celcius),
+    "condition-text" : ("text", None),
+    "condition-code" : ("code", None),
+}
+
+
+class ExtractionException(Exception):
+    """ Extraction exception
+    """
+
+    def __init__(self, value):
+        Exception.__init__(self)
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class ExtractionMap:
+    """ Compiled extraction tables : the values of info.json with their places in the channel data and
+        their conversions, in the order of the xPL messages
+    """
+
+    def __init__(self, current, forecast_keys, forecast_days):
+        """ Use compile_extraction_map() to build it
+            @param current : list of (xPL type, path of the parent dict, keys of the values in the parent dict, conversion)
+            @param forecast_keys : list of (weather.forecast key, field, conversion)
+            @param forecast_days : number of forecast days
+        """
+        self._current = current
+        self._forecast_keys = forecast_keys
+        self.forecast_days = forecast_days
+
+    def get_types(self):
+        """ Return the xPL types of the current values
+        """
+        return [w_type for w_type, path, keys, conversion in self._current]
+
+    def extract_current(self, channel):
+        """ Return the current values of a location
+            @param channel : the channel data of the location
+            @return a list of (xPL type, value). The missing or invalid values are not in the list
+        """
+        values = []
+        for w_type, path, keys, conversion in self._current:
+            try:
+                node = channel
+                for key in path:
+                    node = node[key]
+                if conversion is None:
+                    value = node[keys[0]]
+                else:
+                    value = conversion(*[node[key] for key in keys])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if value is not None:
+                values.append((w_type, value))
+        return values
+
+    def extract_forecasts(self, channel, device):
+        """ Return the weather.forecast data of a location
+            @param channel : the channel data of the location
+            @param device : the location code
+            @return a list of dicts, one for each forecast day. The missing or invalid values are not in the dicts
+        """
+        try:
+            days = channel['item']['forecast'][:self.forecast_days]
+        except (KeyError, TypeError):
+            return []
+        forecasts = []
+        for day_num, day in enumerate(days):
+            data = {'day' : day_num, 'device' : device}
+            for key, field, conversion in self._forecast_keys:
+                try:
+                    value = day[field]
+                    if conversion is not None:
+                        value = conversion(value)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if value is not None:
+                    data[key] = value
+            forecasts.append(data)
+        return forecasts
+
+
+def compile_extraction_map(info_file = INFO_FILE):
+    """ Build the extraction tables from the xpl_stats of info.json
+        @param info_file : the info.json file
+        @return an ExtractionMap
+    """
+    with io.open(info_file, encoding = "utf-8") as fp:
+        xpl_stats = json.load(fp)['xpl_stats']
+
+    current = []
+    forecast_days = 0
+    forecast_keys = set()
+    for name in sorted(xpl_stats):
+        stat = xpl_stats[name]
+        static = dict((param['key'], param['value']) for param in stat['parameters']['static'])
+        if stat['schema'] == "weather.forecast":
+            forecast_days = max(forecast_days, int(static['day']) + 1)
+            forecast_keys.update(param['key'] for param in stat['parameters']['dynamic'])
+            continue
+        if name not in CURRENT_FIELDS:
+            # a value computed by the plugin
+            continue
+        paths, conversion = CURRENT_FIELDS[name]
+        if conversion is None and len(paths) > 1:
+            raise ExtractionException(u"The values of {0} need a conversion".format(name))
+        if len(set(path[:-1] for path in paths)) > 1:
+            raise ExtractionException(u"The values of {0} must be in the same dict".format(name))
+        current.append((static['type'], paths[0][:-1], tuple(path[-1] for path in paths), conversion))
+
+    missing = forecast_keys - set(FORECAST_FIELDS)
+    if len(missing) > 0:
+        raise ExtractionException(u"No Yahoo weather field for the forecast keys {0}".format(u", ".join(sorted(missing))))
+    forecast = [(key, FORECAST_FIELDS[key][0], FORECAST_FIELDS[key][1]) for key in sorted(forecast_keys)]
+    return ExtractionMap(current, forecast, forecast_days)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Local fake Yahoo weather server, for the benchmarks and the offline checks.
+It answers the YQL queries done by the plugin with generated data.
+
+Implements
+==========
+
+- FakeProvider
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import gzip
+import io
+import json
+import random
+import re
+import threading
+import time
+# python 2 and 3
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+
+WOEID_EQUAL = re.compile(r"woeid\s*=\s*'?(\w+)'?")
+WOEID_IN = re.compile(r"woeid\s+in\s*\(([^)]*)\)")
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def make_channel(woeid, padding = 0):
+    """ Build the YQL channel of a location. The values depend on the woeid and on the current hour.
+        @param woeid : the location code
+        @param padding : number of extra bytes put in the description field
+    """
+    seed = sum(ord(char) for char in woeid)
+    now = time.localtime()
+    return {"title" : "Yahoo! Weather - City {0}".format(woeid),
+            "link" : "http://us.rd.yahoo.com/dailynews/rss/weather/Country__Country/*https://weather.yahoo.com/country/state/city-{0}/".format(woeid),
+            "description" : "Yahoo! Weather for City {0}{1}".format(woeid, " " * padding),
+            "lastBuildDate" : time.strftime("%a, %d %b %Y %I:00 %p CEST", now),
+            "location" : {"city" : "City {0}".format(woeid), "country" : "Country", "region" : " Region"},
+            "wind" : {"chill" : str(40 + seed % 30), "direction" : str(seed % 360), "speed" : str(seed % 50)},
+            "atmosphere" : {"humidity" : str(40 + seed % 60), "pressure" : str(990 + seed % 40) + ".0", "rising" : "0", "visibility" : "16.1"},
+            "astronomy" : {"sunrise" : "7:{0:02d} am".format(seed % 60), "sunset" : "8:{0:02d} pm".format(seed % 60)},
+            "item" : {"lat" : str(-60 + seed % 120), "long" : str(-180 + seed % 360),
+                      "condition" : {"code" : str(seed % 48), "date" : time.strftime("%a, %d %b %Y %I:00 %p CEST", now),
+                                     "temp" : str(40 + seed % 40), "text" : "Partly Cloudy"},
+                      "forecast" : [{"code" : str((seed + day) % 48),
+                                     "date" : time.strftime("%d %b %Y", now),
+                                     "day" : DAYS[(now.tm_wday + day) % 7],
+                                     "high" : str(60 + (seed + day) % 30),
+                                     "low" : str(40 + (seed + day) % 20),
+                                     "text" : "Partly Cloudy"} for day in range(10)]}}
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """ Answer the YQL queries
+    """
+    protocol_version = "HTTP/1.1"
+    # send the headers and the body in one packet
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # an idle keep-alive connection is closed after this timeout
+        self.timeout = self.server.provider.idle_timeout
+        BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        provider = self.server.provider
+        provider.count_request()
+        if provider.latency > 0:
+            time.sleep(random.uniform(0, 2 * provider.latency))
+
+        if random.random() < provider.error_rate:
+            self._answer(500, b"Internal error")
+            return
+
+        query = unquote(self.path)
+        match_in = WOEID_IN.search(query)
+        match_equal = WOEID_EQUAL.search(query)
+        if match_in is not None:
+            woeids = [woeid.strip(" '") for woeid in match_in.group(1).split(",")]
+        elif match_equal is not None:
+            woeids = [match_equal.group(1)]
+        else:
+            self._answer(400, b"Bad query")
+            return
+
+        channels = [make_channel(woeid, provider.padding) for woeid in woeids if woeid not in provider.invalid_woeids]
+        if match_in is None and len(channels) == 0:
+            data = {"error" : {"lang" : "en-US", "description" : "Invalid identfier {0}".format(woeids[0])}}
+        elif len(channels) == 0:
+            data = {"query" : {"count" : 0, "results" : None}}
+        elif len(channels) == 1:
+            data = {"query" : {"count" : 1, "results" : {"channel" : channels[0]}}}
+        else:
+            data = {"query" : {"count" : len(channels), "results" : {"channel" : channels}}}
+        self._answer(200, json.dumps(data).encode("utf-8"))
+
+    def _answer(self, status, body):
+        headers = {"Content-Type" : "application/json"}
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj = buf, mode = "wb") as fp:
+                fp.write(body)
+            body = buf.getvalue()
+            headers["Content-Encoding"] = "gzip"
+            self.server.provider.count_gzip_response()
+        self.send_response(status)
+        for key in headers:
+            self.send_header(key, headers[key])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeProviderServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeProvider:
+    """ Local fake Yahoo weather server
+    """
+
+    def __init__(self, latency = 0, error_rate = 0, padding = 0, invalid_woeids = None, port = 0, idle_timeout = None):
+        """ Init the server
+            @param latency : average latency (in seconds) of a response
+            @param error_rate : ratio of the requests which get a HTTP 500 error
+            @param padding : number of extra bytes in each location data
+            @param invalid_woeids : the locations codes which are unknown to the provider
+            @param port : listening port. 0 = a free port
+            @param idle_timeout : time (in seconds) after which an idle connection is closed. None = never
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.padding = padding
+        self.invalid_woeids = set(invalid_woeids or [])
+        self.idle_timeout = idle_timeout
+        self.requests = 0
+        self.gzip_responses = 0
+        self._lock = threading.Lock()
+        self._server = FakeProviderServer(("127.0.0.1", port), FakeProviderHandler)
+        self._server.provider = self
+        self._thread = None
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_gzip_response(self):
+        with self._lock:
+            self.gzip_responses += 1
+
+    def get_url(self):
+        """ Return the url to use instead of YAHOO_WEATHER_URL
+        """
+        return "http://127.0.0.1:{0}/v1/public/yql?q=".format(self._server.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(None, self._server.serve_forever, "fake-provider", (), {})
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
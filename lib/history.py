@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Recent observations of each location, in fixed size ring buffers
+
+Implements
+==========
+
+- LocationHistory
+- History
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import math
+import threading
+from array import array
+
+FIELDS = ["timestamp", "pressure", "temperature", "humidity", "wind_speed", "wind_direction"]
+NAN = float("nan")
+
+TREND_RISING = "rising"
+TREND_STEADY = "steady"
+TREND_FALLING = "falling"
+# pressure change (in mbar) over 3 hours above which the pressure is rising or falling
+TREND_THRESHOLD = 1.0
+
+
+class LocationHistory:
+    """ Ring buffer of the last observations of a location.
+        Each field is stored in an array of doubles, so the memory used does not depend on the plugin uptime.
+        A missing value is stored as NaN.
+    """
+
+    def __init__(self, size):
+        """ @param size : maximum number of observations kept
+        """
+        self._size = size
+        self._next = 0
+        self.count = 0
+        self._fields = dict((name, array("d", [NAN]) * size) for name in FIELDS)
+
+    def add(self, timestamp, pressure = NAN, temperature = NAN, humidity = NAN, wind_speed = NAN, wind_direction = NAN):
+        """ Add an observation. The oldest one is overwritten when the buffer is full
+        """
+        idx = self._next
+        self._fields["timestamp"][idx] = timestamp
+        self._fields["pressure"][idx] = pressure
+        self._fields["temperature"][idx] = temperature
+        self._fields["humidity"][idx] = humidity
+        self._fields["wind_speed"][idx] = wind_speed
+        self._fields["wind_direction"][idx] = wind_direction
+        self._next = (idx + 1) % self._size
+        self.count = min(self.count + 1, self._size)
+
+    def get_values(self, field, window, now):
+        """ Return the (timestamp, value) of a field for the observations of the window, the oldest first.
+            The missing values are skipped.
+            @param field : one of FIELDS
+            @param window : duration (in seconds) of the window
+            @param now : end of the window
+        """
+        timestamps = self._fields["timestamp"]
+        values = self._fields[field]
+        result = []
+        start = (self._next - self.count) % self._size
+        for offset in range(self.count):
+            idx = (start + offset) % self._size
+            if now - timestamps[idx] <= window and not math.isnan(values[idx]):
+                result.append((timestamps[idx], values[idx]))
+        return result
+
+    def get_stats(self, field, window, now):
+        """ Return the min, max and average of a field over a window
+            @return (min, max, average) or None if there are no values in the window
+        """
+        values = [value for timestamp, value in self.get_values(field, window, now)]
+        if len(values) == 0:
+            return None
+        return min(values), max(values), sum(values) / len(values)
+
+    def get_pressure_trend(self, window, now):
+        """ Return the pressure trend over a window : rising, steady or falling.
+            The trend is the slope of a linear regression of the pressure, compared to the usual
+            meteorological threshold (1 mbar in 3 hours).
+            @return the trend or None if the observations do not cover half of the window
+        """
+        values = self.get_values("pressure", window, now)
+        if len(values) < 2 or values[-1][0] - values[0][0] < window / 2.0:
+            return None
+        num = len(values)
+        mean_t = sum(timestamp for timestamp, value in values) / num
+        mean_p = sum(value for timestamp, value in values) / num
+        var_t = sum((timestamp - mean_t) ** 2 for timestamp, value in values)
+        if var_t == 0:
+            return None
+        slope = sum((timestamp - mean_t) * (value - mean_p) for timestamp, value in values) / var_t
+        change_3h = slope * 3 * 3600
+        if change_3h >= TREND_THRESHOLD:
+            return TREND_RISING
+        if change_3h <= -TREND_THRESHOLD:
+            return TREND_FALLING
+        return TREND_STEADY
+
+
+class History:
+    """ The histories of all the locations
+    """
+
+    def __init__(self, size):
+        """ @param size : maximum number of observations kept for each location
+        """
+        self._size = size
+        self._lock = threading.Lock()
+        self._locations = {}
+
+    def get(self, address):
+        """ Return the history of a location (created if needed)
+        """
+        with self._lock:
+            if address not in self._locations:
+                self._locations[address] = LocationHistory(self._size)
+            return self._locations[address]
+
+    def remove(self, address):
+        """ Forget the history of a location
+        """
+        with self._lock:
+            self._locations.pop(address, None)
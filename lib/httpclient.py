@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Small HTTP client used to call the weather provider
+
+Implements
+==========
+
+- HttpClient
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import errno
+import socket
+import threading
+import time
+import zlib
+# python 2 and 3
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException, BadStatusLine
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException, BadStatusLine
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+CHUNK_SIZE = 16384
+# socket errors raised when the server closed an idle connection
+CONNECTION_CLOSED_ERRORS = (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+
+class HttpClientException(Exception):
+    """ Http client exception
+    """
+
+    def __init__(self, value, status = None):
+        Exception.__init__(self)
+        self.value = value
+        self.status = status
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class HttpClient:
+    """ HTTP client which keeps the connections alive and reuse them (one pool per host).
+        The responses are asked compressed (gzip or deflate) and decoded on the fly.
+        This object can be shared between threads.
+    """
+
+    def __init__(self, connect_timeout = 10, read_timeout = 30, max_size = 1048576, max_idle = 4, user_agent = "domogik-plugin-weather"):
+        """ Init the client
+            @param connect_timeout : maximum time (in seconds) to open a connection
+            @param read_timeout : maximum time (in seconds) to get the full response once the connection is opened
+            @param max_size : maximum size (in bytes) of a response, once decoded
+            @param max_idle : maximum number of idle connections kept for each host
+            @param user_agent : the User-Agent header
+        """
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._max_size = max_size
+        self._max_idle = max_idle
+        self._user_agent = user_agent
+        self._lock = threading.Lock()
+        # (scheme, host, port) => list of idle connections
+        self._pool = {}
+        # some counters, for information
+        self.connections_opened = 0
+        self.requests_done = 0
+
+    def get(self, url):
+        """ Do a GET request
+            @param url : the full url
+            @return the decoded response body (bytes)
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path = "{0}?{1}".format(path, parts.query)
+        headers = {"Accept-Encoding" : "gzip, deflate",
+                   "Connection" : "keep-alive",
+                   "User-Agent" : self._user_agent}
+
+        conn, reused = self._get_connection(key)
+        try:
+            response = self._request(conn, path, headers)
+        except (HTTPException, socket.error) as exc:
+            conn.close()
+            if not reused or not is_closed_connection(exc):
+                raise
+            # the server closed the idle connection : retry once with a new one
+            conn, reused = self._new_connection(key), False
+            try:
+                response = self._request(conn, path, headers)
+            except:
+                conn.close()
+                raise
+
+        try:
+            body = self._read(response)
+        except:
+            conn.close()
+            raise
+        self.requests_done += 1
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release_connection(key, conn)
+
+        if response.status != 200:
+            raise HttpClientException(u"HTTP error {0} {1} for {2}".format(response.status, response.reason, url), response.status)
+        return body
+
+    def close(self):
+        """ Close all the idle connections
+        """
+        with self._lock:
+            pool = self._pool
+            self._pool = {}
+        for conns in pool.values():
+            for conn in conns:
+                conn.close()
+
+    def _request(self, conn, path, headers):
+        """ Send the request on a connection and read the response headers
+        """
+        if conn.sock is None:
+            conn.connect()
+        conn.sock.settimeout(self._read_timeout)
+        conn.request("GET", path, headers = headers)
+        return conn.getresponse()
+
+    def _read(self, response):
+        """ Read and decode the response body.
+            The response is read until the end, even for an http error, so the connection can be reused.
+        """
+        encoding = (response.getheader("Content-Encoding") or "").lower()
+        if encoding == "gzip":
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            decoder = DeflateDecoder()
+        else:
+            decoder = None
+
+        deadline = time.time() + self._read_timeout
+        chunks = []
+        size = 0
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if decoder is not None:
+                # never decompress more than allowed (zip bomb...)
+                chunk = decoder.decompress(chunk, self._max_size - size + 1)
+            size += len(chunk)
+            if size > self._max_size:
+                raise HttpClientException(u"Response bigger than {0} bytes".format(self._max_size))
+            if time.time() > deadline:
+                raise HttpClientException(u"Response not received in {0} seconds".format(self._read_timeout))
+            chunks.append(chunk)
+        if decoder is not None:
+            chunk = decoder.flush()
+            size += len(chunk)
+            if size > self._max_size:
+                raise HttpClientException(u"Response bigger than {0} bytes".format(self._max_size))
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _get_connection(self, key):
+        """ Get an idle connection for the host or open a new one
+            @return (connection, True if the connection is reused)
+        """
+        with self._lock:
+            conns = self._pool.get(key)
+            if conns:
+                return conns.pop(), True
+        return self._new_connection(key), False
+
+    def _new_connection(self, key):
+        """ Open a new connection
+        """
+        scheme, host, port = key
+        if scheme == "https":
+            conn = HTTPSConnection(host, port, timeout = self._connect_timeout)
+        else:
+            conn = HTTPConnection(host, port, timeout = self._connect_timeout)
+        conn.connect()
+        self.connections_opened += 1
+        return conn
+
+    def _release_connection(self, key, conn):
+        """ Put back a connection in the pool
+        """
+        with self._lock:
+            conns = self._pool.setdefault(key, [])
+            if len(conns) < self._max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+
+
+def is_closed_connection(exc):
+    """ Tell if an error on a reused connection means that the server closed it while it was idle.
+        A timeout is not : the request may be processed, and a retry would wait again
+    """
+    if isinstance(exc, socket.timeout):
+        return False
+    # no status line (RemoteDisconnected in python 3)
+    if isinstance(exc, BadStatusLine):
+        return True
+    return isinstance(exc, socket.error) and exc.errno in CONNECTION_CLOSED_ERRORS
+
+
+class DeflateDecoder:
+    """ Decoder for the 'deflate' content encoding.
+        Some servers send raw deflate data instead of zlib data : both are handled.
+    """
+
+    def __init__(self):
+        self._decoder = zlib.decompressobj()
+        self._first = True
+
+    def decompress(self, data, max_length = 0):
+        if self._first:
+            self._first = False
+            try:
+                return self._decoder.decompress(data, max_length)
+            except zlib.error:
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(data, max_length)
+
+    def flush(self):
+        return self._decoder.flush()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Light metrics for the polling loop : counters and rolling histograms
+
+Implements
+==========
+
+- Metrics
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+# number of samples kept in each histogram
+HISTOGRAM_SIZE = 1024
+
+
+class Histogram:
+    """ Keep the last samples of a value. Recording a sample is O(1), the statistics are computed on the snapshot
+    """
+
+    def __init__(self, size = HISTOGRAM_SIZE):
+        self._samples = deque(maxlen = size)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, value):
+        self._samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def snapshot(self):
+        """ Return the statistics of the last samples
+        """
+        samples = sorted(self._samples)
+        if len(samples) == 0:
+            return {'count' : self.count}
+        last = len(samples) - 1
+        return {'count' : self.count,
+                'total' : self.total,
+                'min' : samples[0],
+                'max' : samples[last],
+                'avg' : sum(samples) / len(samples),
+                'p50' : samples[int(last * 0.5)],
+                'p90' : samples[int(last * 0.9)],
+                'p99' : samples[int(last * 0.99)]}
+
+
+class Metrics:
+    """ Counters and histograms, shared by all the threads of the plugin.
+        The statistics can be read with snapshot() or dumped in a json file at a regular interval.
+    """
+
+    def __init__(self, log, filename = None, dump_interval = 0):
+        """ Init the metrics
+            @param log : log instance
+            @param filename : json file in which the statistics are dumped. None = no dump
+            @param dump_interval : interval (in seconds) between 2 dumps. 0 = no dump
+        """
+        self.log = log
+        self._filename = filename
+        self._dump_interval = dump_interval
+        self._last_dump = time.time()
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._counters = {}
+        self._histograms = {}
+        # name => callback returning a dict, for the statistics of the other components
+        self._gauges = {}
+
+    def incr(self, name, value = 1):
+        """ Increment a counter
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def record(self, name, value):
+        """ Add a sample to a histogram
+        """
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram()
+            self._histograms[name].record(value)
+
+    def register_gauge(self, name, callback):
+        """ Add the statistics of another component in the snapshots
+            @param callback : function returning a dict
+        """
+        self._gauges[name] = callback
+
+    def snapshot(self):
+        """ Return all the statistics
+            @return a dict
+        """
+        with self._lock:
+            snapshot = {'timestamp' : time.time(),
+                        'uptime' : time.time() - self._start,
+                        'counters' : dict(self._counters),
+                        'histograms' : dict((name, hist.snapshot()) for name, hist in self._histograms.items())}
+        for name, callback in self._gauges.items():
+            try:
+                snapshot[name] = callback()
+            except:
+                self.log.error(u"Error while getting the {0} statistics : {1}".format(name, traceback.format_exc()))
+        return snapshot
+
+    def dump_if_needed(self):
+        """ Dump the statistics in the json file if the dump interval is over
+        """
+        if self._filename is None or self._dump_interval <= 0:
+            return
+        if time.time() - self._last_dump < self._dump_interval:
+            return
+        self._last_dump = time.time()
+        try:
+            tmp_filename = "{0}.tmp".format(self._filename)
+            with open(tmp_filename, "w") as fp:
+                json.dump(self.snapshot(), fp, indent = 4, sort_keys = True)
+            os.rename(tmp_filename, self._filename)
+        except:
+            self.log.error(u"Error while dumping the statistics : {0}".format(traceback.format_exc()))
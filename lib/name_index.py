@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Index of the locations names for the butler : a spoken name ("saint etienne") is matched with the
+device name ("Saint-Étienne") without accents, case and punctuation, and close variants ("st etienne")
+are matched with the trigrams of the names.
+
+Implements
+==========
+
+- normalize_name
+- NameIndex
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import math
+import re
+import unicodedata
+
+# minimal similarity (0 to 1) of a spoken name and a device name
+MIN_CONFIDENCE = 0.6
+
+NOT_ALNUM = re.compile(u"[\\W_]+", re.UNICODE)
+
+
+def normalize_name(name):
+    """ Remove the accents, the case and the punctuation of a name
+        @param name : the name
+        @return the words of the name, separated by one space
+    """
+    if isinstance(name, bytes):
+        name = name.decode("utf-8", "replace")
+    name = unicodedata.normalize("NFKD", name)
+    name = u"".join(char for char in name if not unicodedata.combining(char))
+    return u" ".join(NOT_ALNUM.sub(u" ", name.lower()).split())
+
+
+def trigrams(normalized):
+    """ Return the set of the trigrams of a normalized name. The name is padded, so the start and the end
+        of the name have their own trigrams
+    """
+    padded = u"  {0} ".format(normalized)
+    return set(padded[idx:idx+3] for idx in range(len(padded) - 2))
+
+
+class NameIndex:
+    """ Index of names.
+        The names are found by their normalized name, or else by the similarity of their trigrams
+        (Dice coefficient : 2 * common trigrams / (trigrams of the first + trigrams of the second)).
+        A name with a similarity above the minimal confidence has at least one of the rarest trigrams
+        of the searched name, so only the names with these trigrams are compared.
+    """
+
+    def __init__(self, names, min_confidence = MIN_CONFIDENCE):
+        """ Build the index
+            @param names : the names to index
+            @param min_confidence : minimal similarity of a match
+        """
+        self.min_confidence = min_confidence
+        # normalized name => name
+        self._exact = {}
+        # list of (name, trigrams)
+        self._names = []
+        # trigram => list of positions in self._names
+        self._postings = {}
+        for name in names:
+            normalized = normalize_name(name)
+            if normalized == u"" or normalized in self._exact:
+                continue
+            self._exact[normalized] = name
+            grams = frozenset(trigrams(normalized))
+            position = len(self._names)
+            self._names.append((name, grams))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(position)
+
+    def __len__(self):
+        return len(self._names)
+
+    def match(self, name):
+        """ Find the indexed name closest to a name
+            @param name : the name to find
+            @return (indexed name, confidence) or (None, confidence of the best match) if there is no match
+                    above the minimal confidence or if several names match as well
+        """
+        normalized = normalize_name(name)
+        if normalized in self._exact:
+            return self._exact[normalized], 1.0
+
+        grams = trigrams(normalized)
+        num_grams = len(grams)
+        confidence = self.min_confidence
+        # bounds given by the minimal confidence : number of common trigrams and number of trigrams of a name
+        min_common = int(math.ceil(confidence * num_grams / (2 - confidence)))
+        min_grams = confidence * num_grams / (2 - confidence)
+        max_grams = (2 - confidence) * num_grams / confidence
+        postings = self._postings
+        rarest = sorted(grams, key = lambda gram: len(postings.get(gram, ())))
+        candidates = set()
+        for gram in rarest[:num_grams - min_common + 1]:
+            candidates.update(postings.get(gram, ()))
+
+        best = None
+        best_score = 0.0
+        ambiguous = False
+        names = self._names
+        for position in candidates:
+            name_grams = names[position][1]
+            if not min_grams <= len(name_grams) <= max_grams:
+                continue
+            score = 2.0 * len(grams & name_grams) / (num_grams + len(name_grams))
+            if score > best_score:
+                best, best_score, ambiguous = position, score, False
+            elif score == best_score:
+                ambiguous = True
+        if best is None or ambiguous or best_score < confidence:
+            return None, best_score
+        return names[best][0], best_score
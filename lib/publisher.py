@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Send the xPL messages by bursts, with a rate limit
+
+Implements
+==========
+
+- BatchPublisher
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import time
+import threading
+import traceback
+from collections import deque
+
+# interval (in seconds) between 2 logs of the statistics
+STATS_INTERVAL = 300
+
+
+class BatchPublisher:
+    """ Queue the messages of a device and send them in one burst when the device is flushed.
+        The sending rate is limited with a token bucket : when there are no more tokens, the burst
+        waits, so the hub receive buffers are not overflowed by hundreds of locations.
+    """
+
+    def __init__(self, log, send, stop, max_rate = 100, max_queue = 1000):
+        """ Init the publisher
+            @param log : log instance
+            @param send : callback to send a message
+            @param stop : stop Event, used to interrupt a throttled burst
+            @param max_rate : maximum number of messages sent per second. 0 = no limit
+            @param max_queue : maximum number of queued messages. Over this, the oldest messages are dropped
+        """
+        self.log = log
+        self._send = send
+        self._stop = stop
+        self._max_rate = max_rate
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._max_queue = max_queue
+        # token bucket : a full bucket allows a one second burst
+        self._tokens = float(max_rate)
+        self._last_refill = time.time()
+        # statistics
+        self.sent = 0
+        self.throttled = 0
+        self.dropped = 0
+        self._stats_start = time.time()
+        self._stats_sent = 0
+
+    def queue(self, msg, on_sent = None):
+        """ Queue a message. It will be sent on the next flush()
+            @param on_sent : callback called without parameters once the message is sent. Not called if the message
+                             is dropped
+        """
+        with self._lock:
+            if len(self._queue) >= self._max_queue:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append((msg, on_sent))
+
+    def flush(self):
+        """ Send all the queued messages
+        """
+        with self._lock:
+            msgs = list(self._queue)
+            self._queue.clear()
+        for idx, (msg, on_sent) in enumerate(msgs):
+            if not self._wait_token():
+                with self._lock:
+                    self.dropped += len(msgs) - idx
+                return
+            try:
+                self._send(msg)
+                self.sent += 1
+            except:
+                self.dropped += 1
+                self.log.error(u"Error while sending a xPL message : {0}".format(traceback.format_exc()))
+                continue
+            if on_sent is not None:
+                on_sent()
+        self._log_stats()
+
+    def get_stats(self):
+        """ Return the statistics
+            @return a dict
+        """
+        elapsed = time.time() - self._stats_start
+        return {'sent' : self.sent,
+                'throttled' : self.throttled,
+                'dropped' : self.dropped,
+                'messages_per_second' : (self.sent - self._stats_sent) / elapsed if elapsed > 0 else 0.0}
+
+    def _wait_token(self):
+        """ Take a token in the bucket, waiting for it if needed
+            @return False if the plugin is stopping
+        """
+        if self._max_rate <= 0:
+            return True
+        now = time.time()
+        self._tokens = min(float(self._max_rate), self._tokens + (now - self._last_refill) * self._max_rate)
+        self._last_refill = now
+        if self._tokens < 1:
+            self.throttled += 1
+            self._stop.wait((1 - self._tokens) / self._max_rate)
+            if self._stop.isSet():
+                return False
+            now = time.time()
+            self._tokens = min(float(self._max_rate), self._tokens + (now - self._last_refill) * self._max_rate)
+            self._last_refill = now
+        self._tokens -= 1
+        return True
+
+    def _log_stats(self):
+        """ Log the statistics from time to time
+        """
+        if time.time() - self._stats_start < STATS_INTERVAL:
+            return
+        stats = self.get_stats()
+        self.log.info(u"xPL messages : {0:.1f}/s, {1} sent, {2} throttled, {3} dropped".format(stats['messages_per_second'], stats['sent'], stats['throttled'], stats['dropped']))
+        self._stats_start = time.time()
+        self._stats_sent = self.sent
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Record the raw responses of the weather provider in a file, to replay them later.
+
+File format : a magic line, then one record per response :
+    header (timestamp as a double, key length, body length), key, zlib compressed body
+The key is the comma separated list of the locations codes of the request.
+
+Implements
+==========
+
+- ResponseRecorder
+- read_records
+- merge_records
+- ReplayClient
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+MAGIC = b"WEATHER-RECORDS-1\n"
+HEADER = struct.Struct("<dHI")
+
+
+class RecorderException(Exception):
+    """ Recorder exception
+    """
+
+    def __init__(self, value):
+        Exception.__init__(self)
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class ResponseRecorder:
+    """ Append the raw responses to a records file. Can be used by several threads
+    """
+
+    def __init__(self, filename):
+        """ Open the records file
+            @param filename : the records file. It is created if needed
+        """
+        self.filename = filename
+        directory = os.path.dirname(filename)
+        if directory != "" and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._fp = open(filename, "ab")
+        if self._fp.tell() == 0:
+            self._fp.write(MAGIC)
+        self.records = 0
+
+    def record(self, timestamp, addresses, body):
+        """ Append a response
+            @param timestamp : time of the response
+            @param addresses : list of the locations codes of the request
+            @param body : the raw response (bytes)
+        """
+        key = ",".join(addresses).encode("utf-8")
+        compressed = zlib.compress(body)
+        with self._lock:
+            self._fp.write(HEADER.pack(timestamp, len(key), len(compressed)))
+            self._fp.write(key)
+            self._fp.write(compressed)
+            self._fp.flush()
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+
+def read_records(filename):
+    """ Read a records file. The file is memory mapped, so a large file is not loaded in memory
+        @return a generator of (timestamp, list of addresses, body)
+    """
+    with open(filename, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size < len(MAGIC):
+            return
+        data = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            if data[:len(MAGIC)] != MAGIC:
+                raise RecorderException(u"{0} is not a records file".format(filename))
+            offset = len(MAGIC)
+            size = len(data)
+            while offset + HEADER.size <= size:
+                timestamp, key_length, body_length = HEADER.unpack_from(data, offset)
+                offset += HEADER.size
+                end = offset + key_length + body_length
+                # the last record may be incomplete if the plugin was stopped while writing it
+                if end > size:
+                    break
+                key = data[offset:offset+key_length].decode("utf-8")
+                body = zlib.decompress(data[offset+key_length:end])
+                offset = end
+                yield timestamp, key.split(","), body
+        finally:
+            data.close()
+
+
+def merge_records(filenames):
+    """ Read several records files (the files of the shards for example) in the order of the records times
+        @return a generator of (timestamp, list of addresses, body)
+    """
+    # the file number and the record number keep the order of the records with the same time
+    readers = [((timestamp, file_num, record_num, addresses, body)
+                for record_num, (timestamp, addresses, body) in enumerate(read_records(filename)))
+               for file_num, filename in enumerate(filenames)]
+    for timestamp, file_num, record_num, addresses, body in heapq.merge(*readers):
+        yield timestamp, addresses, body
+
+
+class ReplayClient:
+    """ Replace the http client of a Weather object : it returns the body of the record being replayed
+    """
+
+    def __init__(self):
+        self.body = None
+
+    def get(self, url):
+        return self.body
+
+    def close(self):
+        pass
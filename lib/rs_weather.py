@@ -33,12 +33,197 @@ Implements
 """
 
 from domogik.butler.brain import get_sensor_value
+from domogik_packages.plugin_weather.lib.name_index import NameIndex
 import datetime
 
+# locale => compiled i18n data (see compile_i18n)
+COMPILED_I18N = {}
+
+# sensor of all the weather devices : the names of the devices with it are in the names index
+LOCATION_REFERENCE = "current_temperature"
+
+
+def devices_signature(devices):
+    """ Return the signature of a devices list : the id and the name of each device.
+        A device replaced, added, removed or renamed changes the signature.
+        @devices : devices list in the butler memory
+        @return the signature, or None if the devices list has an unexpected format
+    """
+    try:
+        return tuple([(id(a_device), a_device['name']) for a_device in devices])
+    except (KeyError, TypeError):
+        return None
+
+
+class SensorIndex:
+    """ Index of the butler devices by (device name, sensor reference), with an index of the weather
+        devices names for the spoken names. The index only narrows the devices given to get_sensor_value(),
+        which still does the matching and reads the values : the answers are the ones of the butler lookup.
+        The index is refreshed once per question with a cheap key (the devices list and its length). The devices
+        found are checked (same position and same name in the list), and the index is rebuilt from the full
+        signature (see devices_signature()) when they changed or when a name is not found.
+    """
+
+    def __init__(self):
+        # keep a reference on the indexed devices list, so its id can't be reused by another list
+        self._devices = None
+        self._key = None
+        self._signature = None
+        # (device name, sensor reference) => list of (position, name, device)
+        self._index = {}
+        self._names = NameIndex([])
+
+    def refresh(self, devices, full = False):
+        """ Rebuild the indexes if the devices list changed. Called once at the start of a question
+            @devices : devices list in the butler memory
+            @full : False = check only the devices list and its length, True = check the signature of all the devices
+        """
+        key = (id(devices), len(devices))
+        if not full and key == self._key:
+            return
+        signature = devices_signature(devices)
+        if signature is None or signature != self._signature:
+            self._build(devices, signature)
+        self._key = key
+
+    def resolve_name(self, device_name):
+        """ Find the weather device name matching a spoken location name
+            @device_name : the spoken name (None = any device)
+            @return the device name, or the spoken name if no device name matches it well enough
+        """
+        if device_name is None:
+            return None
+        name, confidence = self._names.match(device_name)
+        if name is None:
+            return device_name
+        return name
+
+    def get_devices(self, devices, device_name, reference):
+        """ Return the devices in which a sensor must be searched
+            @devices : devices list in the butler memory
+            @device_name : the device name (None = any device)
+            @reference : the sensor reference
+            @return the indexed devices, or None if the index does not know them or if they changed since the last build
+        """
+        if device_name is not None:
+            device_name = device_name.strip().lower()
+        matches = self._index.get((device_name, reference))
+        if matches is None:
+            return None
+        found = []
+        for position, name, a_device in matches:
+            if position >= len(devices) or devices[position] is not a_device or a_device.get('name') != name:
+                return None
+            found.append(a_device)
+        return found
+
+    def _build(self, devices, signature):
+        """ Build the indexes
+        """
+        index = {}
+        try:
+            for position, a_device in enumerate(devices):
+                entry = (position, a_device['name'], a_device)
+                name = a_device['name'].strip().lower()
+                for a_sensor in a_device['sensors'].values():
+                    index.setdefault((name, a_sensor['reference']), []).append(entry)
+                    index.setdefault((None, a_sensor['reference']), []).append(entry)
+        except (KeyError, TypeError, AttributeError):
+            # unexpected devices format : no index, the full list will be used
+            index = {}
+        self._index = index
+        self._names = NameIndex(name for position, name, a_device in index.get((None, LOCATION_REFERENCE), []))
+        self._devices = devices
+        self._signature = signature
+
+
+SENSOR_INDEX = SensorIndex()
+
+
+def find_location(devices, spoken_name, reference):
+    """ Find the devices of a location for a question. The index is refreshed here, once per question
+        @devices : devices list in the butler memory
+        @spoken_name : the location name given by the user (None = any device)
+        @reference : a sensor reference of the location
+        @return (device name, devices to give to get_sensor_value()). The full devices list is returned
+                when the index does not find the location : get_sensor_value() does its own matching
+    """
+    for full in (False, True):
+        SENSOR_INDEX.refresh(devices, full)
+        device_name = SENSOR_INDEX.resolve_name(spoken_name)
+        location = SENSOR_INDEX.get_devices(devices, device_name, reference)
+        if location is not None:
+            return device_name, location
+    return device_name, devices
+
+
+def get_compiled_i18n(locale):
+    """ Return the compiled i18n data of a locale or None if the locale is not compiled yet
+        @locale : the locale (fr_FR, ...)
+    """
+    return COMPILED_I18N.get(locale)
+
+
+def compile_i18n(cfg_i18n):
+    """ Build the lookup tables of the i18n data once for all. The result is kept for the locale.
+        @cfg_i18n : i18n data
+        @return the compiled i18n data : the i18n data with these additionnal keys
+                days_absolute_lower : lowercased absolute days => day of the week
+                days_relative_lower : lowercased relative days => day number
+                day_labels : day number => label
+    """
+    compiled = dict(cfg_i18n)
+    if 'days_absolute' in cfg_i18n:
+        compiled['days_absolute_lower'] = dict((k.lower(), v) for k, v in cfg_i18n['days_absolute'].items())
+    if 'days_relative' in cfg_i18n:
+        compiled['days_relative_lower'] = dict((k.lower(), v) for k, v in cfg_i18n['days_relative'].items())
+        # the first label found for a day number is used
+        day_labels = {}
+        for a_day in cfg_i18n['days_relative']:
+            day_labels.setdefault(cfg_i18n['days_relative'][a_day], a_day)
+        compiled['day_labels'] = day_labels
+    COMPILED_I18N[cfg_i18n['locale']] = compiled
+    return compiled
+
+
+def resolve_day(cfg_i18n, day):
+    """ Translate the requested day to a day number
+        @cfg_i18n : compiled i18n data
+        @day : the day given by the user (a number, an absolute day or a relative day)
+        @return the day number (as given if it can't be translated)
+    """
+    # if the user give a fullname day... we translate to a number
+    if day in cfg_i18n['days_absolute_lower']:
+        current_day = datetime.datetime.today().weekday()
+        day = (cfg_i18n['days_absolute_lower'][day] - current_day) % 7
+
+    # if the user give a full relative day... we translate to a number
+    if day in cfg_i18n['days_relative_lower']:
+        day = cfg_i18n['days_relative_lower'][day]
+    return day
+
+
+def get_sensor_values(log, location, locale, device_name, sensors):
+    """ Return the last values of several sensors of a location
+        @log : callback to log object
+        @location : the devices of the location (see find_location())
+        @locale : the locale (fr_FR, ...)
+        @device_name : the device name (None = any device)
+        @sensors : list of (data type, sensor reference). The first sensor is used to find the device
+        @return the list of the values (None for a missing sensor)
+    """
+    values = []
+    for data_type, reference in sensors:
+        values.append(get_sensor_value(log, location, locale, data_type, device_name, reference))
+        # no such device
+        if values[0] is None:
+            return [None] * len(sensors)
+    return values
+
 
 def get_forecast(cfg_i18n, args, log, devices):
     """ Function for the brain part
-        @cfg_i18n : i18n data
+        @cfg_i18n : i18n data (compiled or not)
         @args : a list of args. 0 => day (0 = current day)
                                 1 => device name (the location name)
         @log : callback to log object
@@ -47,10 +232,10 @@ def get_forecast(cfg_i18n, args, log, devices):
     """
 
     # i18n
+    if 'day_labels' not in cfg_i18n:
+        cfg_i18n = compile_i18n(cfg_i18n)
     locale = cfg_i18n['locale']
     condition_text_list = cfg_i18n['condition_text_list']
-    days_absolute = cfg_i18n['days_absolute']
-    days_relative = cfg_i18n['days_relative']
     ERROR_UNKNOWN_DAY = cfg_i18n['ERROR_UNKNOWN_DAY']
     ERROR_UNKNOWN_LOCATION = cfg_i18n['ERROR_UNKNOWN_LOCATION']
     SEPARATOR = cfg_i18n['SEPARATOR']
@@ -63,20 +248,11 @@ def get_forecast(cfg_i18n, args, log, devices):
     day = tab_args[0]
     # si on ne precise pas le lieu, on suppose qu'un seul device existe
     if len(tab_args) == 1:
-        device_name = None
+        device_name, location = find_location(devices, None, "current_temperature")
     else:
-        device_name = tab_args[1]
+        device_name, location = find_location(devices, tab_args[1], "current_temperature")
     
-    # if the user give a fullname day... we translate to a number
-    buf = dict((k.lower(), v) for k, v in days_absolute.iteritems())
-    if day in buf:
-        current_day = datetime.datetime.today().weekday()
-        day = (buf[day] - current_day) % 7
-
-    # if the user give a full relative day... we translate to a number
-    buf = dict((k.lower(), v) for k, v in days_relative.iteritems())
-    if day in buf:
-        day = buf[day]
+    day = resolve_day(cfg_i18n, day)
 
     # we check if we are able to give the information about the requested day
     try:
@@ -91,22 +267,20 @@ def get_forecast(cfg_i18n, args, log, devices):
         
 
 
-    temp_high = get_sensor_value(log, devices, locale, "DT_Temp", device_name, "forecast_{0}_temperature_high".format(day))
+    # all the sensors of the location are on the same device
+    temp_high, temp_low, temp_current, condition_code = get_sensor_values(log, location, locale, device_name,
+                                                                          [("DT_Temp", "forecast_{0}_temperature_high".format(day)),
+                                                                           ("DT_Temp", "forecast_{0}_temperature_low".format(day)),
+                                                                           ("DT_Temp", "current_temperature"),
+                                                                           ("DT_String", "forecast_{0}_condition_code".format(day))])
     # no such device
     if temp_high == None:
         return ERROR_UNKNOWN_LOCATION
 
-    temp_low = get_sensor_value(log, devices, locale, "DT_Temp", device_name, "forecast_{0}_temperature_low".format(day))
-    temp_current = get_sensor_value(log, devices, locale, "DT_Temp", device_name, "current_temperature")
-    condition_code = get_sensor_value(log, devices, locale, "DT_String", device_name, "forecast_{0}_condition_code".format(day))
     condition_text = condition_text_list[int(condition_code)]
 
     # find the day label
-    print(days_relative)
-    for a_day in days_relative:
-        if days_relative[a_day] == day:
-            day_label = a_day
-            break
+    day_label = cfg_i18n['day_labels'].get(day, day)
 
     # i18n
     txt = u"{0}, ".format(day_label)
@@ -138,11 +312,11 @@ def get_temperature(cfg_i18n, args, log, devices):
 
     print(args) 
     if len(args) > 0:
-        device_name = ' '.join(args)
+        device_name, location = find_location(devices, ' '.join(args), "current_temperature")
     else:
-        device_name = None
+        device_name, location = find_location(devices, None, "current_temperature")
     
-    temp = get_sensor_value(log, devices, locale, "DT_Temp", device_name, "current_temperature")
+    temp = get_sensor_value(log, location, locale, "DT_Temp", device_name, "current_temperature")
     # no such device
     if temp == None:
         return ERROR_UNKNOWN_LOCATION
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Polling scheduler : each location has its own next due time
+
+Implements
+==========
+
+- Scheduler
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import heapq
+import random
+import threading
+import time
+from datetime import datetime
+
+# Example : Sat, 10 Sep 2016 04:00 PM CEST (the timezone is ignored : only the difference between 2 dates is used)
+LAST_BUILD_DATE_FORMAT = "%a, %d %b %Y %I:%M %p"
+# jitter applied to each polling interval (ratio of the interval)
+JITTER = 0.1
+# when a location data did not change, the interval is multiplied by this
+BACKOFF_FACTOR = 1.5
+# delay (in seconds) after the expected provider update before polling
+UPDATE_MARGIN = 60
+# jitter applied to the retry delay after a failure (ratio of the delay)
+FAILURE_JITTER = 0.5
+# number of consecutive errors of a location (an invalid location code for example) after which it is no more polled
+# for a while (circuit opened). The network and provider failures are not counted
+CIRCUIT_FAILURES = 5
+# delay (in seconds) before polling again a location with an opened circuit
+CIRCUIT_OPEN_DELAY = 6 * 3600
+
+
+def parse_last_build_date(value):
+    """ Parse the lastBuildDate of Yahoo weather
+        @return a datetime or None if the date can't be parsed
+    """
+    try:
+        return datetime.strptime(value.rsplit(" ", 1)[0], LAST_BUILD_DATE_FORMAT)
+    except (ValueError, AttributeError):
+        return None
+
+
+class LocationSchedule:
+    """ Polling state of a location
+    """
+
+    def __init__(self, interval, phase, fixed):
+        # current polling interval (in seconds)
+        self.interval = interval
+        # offset (in seconds) inside the base interval, to spread the locations
+        self.phase = phase
+        # True if the interval is forced for the location (no adaptation)
+        self.fixed = fixed
+        self.due = 0
+        # True while the location is being polled
+        self.pending = False
+        self.first_poll = True
+        self.last_build_date = None
+        # time at which a new lastBuildDate was seen
+        self.last_change = None
+        # estimated delay (in seconds) between 2 updates of the provider
+        self.provider_period = None
+        # number of consecutive failed polls
+        self.retries = 0
+        # number of consecutive failed polls caused by an error of the location itself
+        self.failures = 0
+
+
+class Scheduler:
+    """ Priority queue of the locations to poll, ordered by their next due time.
+        The locations are spread over the interval. The polling interval of each location adapts to the
+        provider updates (lastBuildDate) : it polls just after an expected update and backs off while the
+        data do not change. After a failure, a location is retried with an exponential backoff, up to the maximum
+        interval. After CIRCUIT_FAILURES consecutive errors of the location itself (not a network or provider failure,
+        which affects all the locations), it is only retried every CIRCUIT_OPEN_DELAY (circuit breaker).
+    """
+
+    def __init__(self, interval, min_interval, max_interval, overrides = None):
+        """ Init the scheduler
+            @param interval : base polling interval (in seconds)
+            @param min_interval : minimum polling interval (in seconds)
+            @param max_interval : maximum polling interval (in seconds)
+            @param overrides : dict address => polling interval (in seconds) for the locations with a fixed interval
+        """
+        self._interval = interval
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._overrides = overrides or {}
+        self._lock = threading.Lock()
+        self._heap = []
+        # address => LocationSchedule
+        self._locations = {}
+
+    def set_locations(self, addresses, now = None):
+        """ Set the locations to poll. The new locations are due now and spread over the interval after their first poll.
+            The removed locations are forgotten.
+            @param addresses : list of the locations codes
+        """
+        if now is None:
+            now = time.time()
+        addresses = list(addresses)
+        kept = set(addresses)
+        with self._lock:
+            for address in list(self._locations):
+                if address not in kept:
+                    del self._locations[address]
+            for idx, address in enumerate(addresses):
+                if address in self._locations:
+                    continue
+                phase = self._interval * float(idx) / len(addresses)
+                if address in self._overrides:
+                    schedule = LocationSchedule(self._overrides[address], phase, True)
+                else:
+                    schedule = LocationSchedule(self._interval, phase, False)
+                schedule.due = now
+                self._locations[address] = schedule
+            self._rebuild_heap()
+
+    def next_due(self):
+        """ Return the next due time, or None if there is no location
+        """
+        with self._lock:
+            # drop the entries of removed or already rescheduled locations
+            while len(self._heap) > 0 and not self._is_current(*self._heap[0]):
+                heapq.heappop(self._heap)
+            if len(self._heap) == 0:
+                return None
+            return self._heap[0][0]
+
+    def pop_due(self, now = None):
+        """ Return the locations which are due. They are removed from the queue until they are rescheduled by polled()
+            @return list of addresses
+        """
+        if now is None:
+            now = time.time()
+        due = []
+        with self._lock:
+            while len(self._heap) > 0 and self._heap[0][0] <= now:
+                when, address = heapq.heappop(self._heap)
+                # skip the entries of removed or already rescheduled locations
+                if self._is_current(when, address):
+                    self._locations[address].pending = True
+                    due.append(address)
+        return due
+
+    def polled(self, address, last_build_date = None, now = None):
+        """ Reschedule a location after a poll
+            @param address : the location code
+            @param last_build_date : the lastBuildDate of the data. None if the poll failed
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            schedule = self._locations.get(address)
+            if schedule is None:
+                return
+            if last_build_date is not None:
+                schedule.retries = 0
+                schedule.failures = 0
+            delay = self._compute_delay(schedule, last_build_date, now)
+            self._push(address, schedule, delay * (1 + random.uniform(-JITTER, JITTER)), now)
+
+    def failed(self, address, location_error = True, now = None):
+        """ Reschedule a location after a failed poll, with an exponential backoff
+            @param address : the location code
+            @param location_error : True if the error is specific to the location (invalid location code, ...),
+                                    False for a network or provider failure. Only the first ones open the circuit
+            @return the number of consecutive errors of the location itself
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            schedule = self._locations.get(address)
+            if schedule is None:
+                return 0
+            schedule.retries += 1
+            if location_error:
+                schedule.failures += 1
+            if schedule.failures >= CIRCUIT_FAILURES:
+                delay = CIRCUIT_OPEN_DELAY
+            else:
+                delay = self._min_interval * 2 ** min(schedule.retries - 1, 16)
+                delay = min(delay * (1 + random.uniform(-FAILURE_JITTER, FAILURE_JITTER)), self._max_interval)
+            self._push(address, schedule, delay, now)
+            return schedule.failures
+
+    def is_first_poll(self, address):
+        """ Return True if a location has not been polled yet (or is unknown)
+        """
+        with self._lock:
+            schedule = self._locations.get(address)
+            return schedule is None or schedule.first_poll
+
+    def is_circuit_open(self, address):
+        """ Return True if a location failed too many times in a row
+        """
+        with self._lock:
+            schedule = self._locations.get(address)
+            return schedule is not None and schedule.failures >= CIRCUIT_FAILURES
+
+    def get_stats(self):
+        """ Return the number of locations, of failing locations and of opened circuits
+        """
+        with self._lock:
+            failures = [(schedule.retries, schedule.failures) for schedule in self._locations.values()]
+        return {'locations' : len(failures),
+                'failing' : len([retries for retries, num in failures if retries > 0]),
+                'circuits_open' : len([num for retries, num in failures if num >= CIRCUIT_FAILURES])}
+
+    def reschedule_pending(self, now = None):
+        """ Reschedule the locations which were popped but not polled (as failed polls)
+        """
+        with self._lock:
+            pending = [address for address, schedule in self._locations.items() if schedule.pending]
+        for address in pending:
+            self.polled(address, None, now)
+
+    def get_interval(self, address):
+        """ Return the current polling interval (in seconds) of a location
+        """
+        with self._lock:
+            return self._locations[address].interval
+
+    def _compute_delay(self, schedule, last_build_date, now):
+        """ Compute the delay before the next poll of a location and adapt its interval
+        """
+        if schedule.fixed or last_build_date is None:
+            return schedule.interval
+
+        if last_build_date != schedule.last_build_date:
+            # new data : estimate the provider period from the 2 last build dates
+            new_date = parse_last_build_date(last_build_date)
+            old_date = parse_last_build_date(schedule.last_build_date)
+            if new_date is not None and old_date is not None and new_date > old_date:
+                period = (new_date - old_date).seconds + (new_date - old_date).days * 86400
+                schedule.provider_period = period
+            schedule.last_build_date = last_build_date
+            schedule.last_change = now
+            schedule.interval = self._interval
+        else:
+            # no new data : back off
+            schedule.interval = min(schedule.interval * BACKOFF_FACTOR, self._max_interval)
+
+        delay = schedule.interval
+        if schedule.provider_period is not None:
+            # poll just after the next expected update of the provider if it comes before
+            expected = schedule.last_change + schedule.provider_period + UPDATE_MARGIN
+            while expected <= now:
+                expected += schedule.provider_period
+            delay = min(delay, expected - now)
+        return max(delay, self._min_interval)
+
+    def _is_current(self, when, address):
+        """ Tell if an entry of the queue is the current due time of a location. The lock must be held
+        """
+        schedule = self._locations.get(address)
+        return schedule is not None and not schedule.pending and schedule.due == when
+
+    def _push(self, address, schedule, delay, now):
+        """ Put back a location in the queue. The lock must be held
+        """
+        if schedule.first_poll:
+            # spread the locations over the interval
+            schedule.first_poll = False
+            delay += schedule.phase
+        schedule.pending = False
+        schedule.due = now + delay
+        heapq.heappush(self._heap, (schedule.due, address))
+
+    def _rebuild_heap(self):
+        """ Rebuild the priority queue from the locations
+        """
+        self._heap = [(schedule.due, address) for address, schedule in self._locations.items() if not schedule.pending]
+        heapq.heapify(self._heap)
+
+
+def parse_interval_overrides(value):
+    """ Parse the per location polling intervals
+        @param value : string like '615702=30,2459115=5' (location code = interval in minutes)
+        @return a dict address => interval in seconds
+    """
+    overrides = {}
+    if not value:
+        return overrides
+    for item in value.split(","):
+        item = item.strip()
+        if item == "":
+            continue
+        address, interval = item.split("=")
+        overrides[address.strip()] = int(interval) * 60
+    return overrides
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Worker processes which fetch and decode the locations of their shard and extract their values.
+Only the extracted values are sent back to the plugin process, which publishes them on its xPL connection.
+
+Implements
+==========
+
+- shard_of
+- shard_record_filename
+- ShardPool
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import zlib
+# python 2 and 3
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+# time (in seconds) given to the workers to stop before they are killed
+STOP_TIMEOUT = 5
+
+
+def shard_of(address, num_shards):
+    """ Return the shard of a location. The shard only depends on the location code, so a location is
+        always fetched by the same worker
+        @param address : the location code
+        @param num_shards : number of shards
+    """
+    return (zlib.crc32(address.encode("utf-8")) & 0xffffffff) % num_shards
+
+
+def shard_record_filename(filename, shard):
+    """ Return the records file of a shard : each worker records its responses in its own file
+        @param filename : the records file of the plugin (record_filename option)
+        @param shard : the shard number
+    """
+    root, ext = os.path.splitext(filename)
+    return "{0}-shard{1}{2}".format(root, shard, ext)
+
+
+def shard_worker(shard, jobs, results, stop, log_name, options):
+    """ Main function of a worker process : fetch the chunks of locations of the jobs queue and put the results
+        in the results queue, until the stop event is set
+        @param shard : the shard number
+        @param jobs : queue of chunks. A chunk is a list of (device, address)
+        @param results : queue of (shard, list of (address, observation, error)). See Weather._fetch_chunk()
+        @param stop : multiprocessing event
+        @param log_name : name of the plugin logger
+        @param options : Weather options (timeouts, url, records file, ...)
+    """
+    # the plugin process handles the signals
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # imported here as the weather module uses this one
+    from domogik_packages.plugin_weather.lib.weather import Weather
+    log = logging.getLogger(log_name)
+    options = dict(options)
+    if options.get('record_filename') is not None:
+        options['record_filename'] = shard_record_filename(options['record_filename'], shard)
+    weather = Weather(log, None, None, stop, None, **options)
+
+    def fetcher():
+        while not stop.is_set():
+            try:
+                chunk = jobs.get(True, 1)
+            except Empty:
+                continue
+            results.put((shard, weather._fetch_chunk(chunk)))
+
+    threads = []
+    for idx in range(options.get('max_concurrency', 1)):
+        thr = threading.Thread(None, fetcher, "weather-shard-{0}-{1}".format(shard, idx), (), {})
+        thr.setDaemon(True)
+        thr.start()
+        threads.append(thr)
+    for thr in threads:
+        thr.join()
+    if weather._recorder is not None:
+        weather._recorder.close()
+
+
+class ShardStats:
+    """ Health of a shard, seen from the plugin process
+    """
+
+    def __init__(self):
+        self.chunks_sent = 0
+        self.results = 0
+        self.errors = 0
+        self.restarts = 0
+        self.last_result = None
+
+
+class ShardPool:
+    """ The worker processes. Each worker has its own jobs queue and all the workers share the results queue.
+        A dead worker is restarted by check(). Its jobs queue is kept, so the chunks waiting in it are not lost.
+    """
+
+    def __init__(self, log, num_shards, options):
+        """ Init the pool. The processes are started by start()
+            @param log : log instance
+            @param num_shards : number of worker processes
+            @param options : Weather options given to the workers (timeouts, url, records file, ...)
+        """
+        self.log = log
+        self.num_shards = num_shards
+        self._options = options
+        self._lock = threading.Lock()
+        self._stop = multiprocessing.Event()
+        self._results = multiprocessing.Queue()
+        self._jobs = [multiprocessing.Queue() for shard in range(num_shards)]
+        self._processes = [None] * num_shards
+        self._stats = [ShardStats() for shard in range(num_shards)]
+
+    def start(self):
+        for shard in range(self.num_shards):
+            self._start_worker(shard)
+
+    def _start_worker(self, shard):
+        process = multiprocessing.Process(target = shard_worker,
+                                          name = "weather-shard-{0}".format(shard),
+                                          args = (shard, self._jobs[shard], self._results, self._stop, self.log.name, self._options))
+        process.daemon = True
+        process.start()
+        self._processes[shard] = process
+        self.log.info(u"Shard {0} started (pid {1})".format(shard, process.pid))
+
+    def dispatch(self, shard, chunk):
+        """ Give a chunk of locations to a worker
+            @param chunk : list of (device, address). The device is only used in the logs
+        """
+        self._jobs[shard].put([({'name' : a_device['name']}, address) for a_device, address in chunk])
+        with self._lock:
+            self._stats[shard].chunks_sent += 1
+
+    def get(self, timeout):
+        """ Return the results of a chunk : (shard, list of (address, observation, error)) or None if there are no results in time
+        """
+        try:
+            shard, results = self._results.get(True, timeout)
+        except Empty:
+            return None
+        with self._lock:
+            stats = self._stats[shard]
+            stats.results += len(results)
+            stats.errors += len([error for address, observation, error in results if error is not None])
+            stats.last_result = time.time()
+        return shard, results
+
+    def check(self):
+        """ Restart the dead workers
+        """
+        if self._stop.is_set():
+            return
+        for shard, process in enumerate(self._processes):
+            if process is not None and not process.is_alive():
+                self.log.warning(u"Shard {0} (pid {1}) died with the exit code {2}. It is restarted".format(shard, process.pid, process.exitcode))
+                with self._lock:
+                    self._stats[shard].restarts += 1
+                self._start_worker(shard)
+
+    def get_stats(self):
+        """ Return the health of each shard
+        """
+        stats = {}
+        with self._lock:
+            for shard, process in enumerate(self._processes):
+                shard_stats = self._stats[shard]
+                stats["shard_{0}".format(shard)] = {'pid' : process.pid if process is not None else None,
+                                                    'alive' : process is not None and process.is_alive(),
+                                                    'chunks_sent' : shard_stats.chunks_sent,
+                                                    'results' : shard_stats.results,
+                                                    'errors' : shard_stats.errors,
+                                                    'restarts' : shard_stats.restarts,
+                                                    'last_result_age' : None if shard_stats.last_result is None else time.time() - shard_stats.last_result}
+        return stats
+
+    def stop(self):
+        """ Stop the workers
+        """
+        self._stop.set()
+        for process in self._processes:
+            if process is not None:
+                process.join(STOP_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+        self.log.info(u"Shards stopped")
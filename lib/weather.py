@@ -34,188 +34,838 @@ Implements
 @organization: Domogik
 """
 
+import math
 import os
+import re
 import traceback
+import cProfile
+import pstats
 import json
 import time
+import threading
 # python 2 and 3
 try:
-    from urllib.request import urlopen
+    from urllib.parse import quote
 except ImportError:
-    from urllib import urlopen
+    from urllib import quote
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from domogik_packages.plugin_weather.lib.httpclient import HttpClient, HttpClientException
+from domogik_packages.plugin_weather.lib.cache import ResponseCache
+from domogik_packages.plugin_weather.lib.scheduler import Scheduler, CIRCUIT_FAILURES, CIRCUIT_OPEN_DELAY
+from domogik_packages.plugin_weather.lib.metrics import Metrics
+from domogik_packages.plugin_weather.lib.history import History, NAN
+from domogik_packages.plugin_weather.lib.astronomy import Astronomy
+from domogik_packages.plugin_weather.lib.derived import DerivedMetrics
+from domogik_packages.plugin_weather.lib.shards import ShardPool, shard_of, shard_record_filename
+from domogik_packages.plugin_weather.lib.recorder import ResponseRecorder, ReplayClient, merge_records
+from domogik_packages.plugin_weather.lib.extraction import compile_extraction_map, mph_to_kmh, fahrenheit_to_celcius
 
 YAHOO_WEATHER_URL = "https://query.yahooapis.com/v1/public/yql?q="
+WOEID_IN_LINK = re.compile(r"-(\w+)/?$")
+# at startup, the cached data older than this are not sent
+CACHE_WARM_START_MAX_AGE = 86400 # seconds
+# bounds of the adaptive polling interval
+MIN_INTERVAL = 5 # minutes
+MAX_INTERVAL = 60 # minutes
+# while waiting for the next location to poll, a devices update is checked at this interval
+WAKEUP_CHECK_INTERVAL = 1 # seconds
+# in sharded mode, the cycle is abandoned when no result comes during this number of request timeouts
+SHARD_IDLE_TIMEOUTS = 2
+
+def get_number(channel, function, *keys):
+    """ Return a value of the channel data as a float, or NaN if it is missing or invalid
+        @param function : conversion applied to the value
+        @param keys : path of the value in the channel data
+    """
+    try:
+        item = channel
+        for key in keys:
+            item = item[key]
+        return float(function(item))
+    except (KeyError, TypeError, ValueError):
+        return NAN
+
+
+class WeatherException(Exception):
+    """ Weather exception
+    """
+
+    def __init__(self, value):
+        Exception.__init__(self)
+        self.value = value
 
-def mph_to_kmh(s):
-    # yahoo return some values in mph but in fact they are in km/h... so I commented the conversion
-    #return float(s)/1.6093
-    return float(s)
+    def __str__(self):
+        return repr(self.value)
 
-def fahrenheit_to_celcius(f):
-    return "{0:.0f}".format((float(f)-32)/1.8)
 
 class Weather:
     """ Weather.com
     """
 
-    def __init__(self, log, callback_sensor_basic, callback_weather_forecast, stop, get_parameter_for_feature):
+    def __init__(self, log, callback_sensor_basic, callback_weather_forecast, stop, get_parameter_for_feature,
+                 max_concurrency = 1, timeout = 30, batch_size = 1, connect_timeout = 10, max_response_size = 1024,
+                 cache_directory = None, cache_ttl = 10, cache_max_size = 10240, callback_flush = None,
+                 interval_overrides = None, url = YAHOO_WEATHER_URL, metrics = None, profile_every = 0, profile_directory = None,
+                 history_size = 96, trend_window = 180, max_staleness = 360, shards = 0, record_filename = None):
         """ Init Weather object
             @param log : log instance
             @param callback_sensor_basic : callback to send a sensor.basic xpl message
             @param callback_weather_forecast : callback to send a weather.forecast xpl message
+            @param max_concurrency : maximum number of locations fetched at the same time
+            @param timeout : maximum time (in seconds) allowed for each request to Yahoo weather
+            @param batch_size : maximum number of locations grabbed in one request to Yahoo weather
+            @param connect_timeout : maximum time (in seconds) to open a connection to Yahoo weather
+            @param max_response_size : maximum size (in KB) of a response from Yahoo weather
+            @param cache_directory : directory of the responses cache. None = no cache
+            @param cache_ttl : time (in minutes) during which a cached response is used instead of calling Yahoo weather
+                               for the first poll of a location
+            @param cache_max_size : maximum size (in KB) of the responses cache
+            @param callback_flush : callback called with the address when all the xpl messages of a location are given
+            @param interval_overrides : dict address => polling interval (in seconds) for the locations with a fixed interval
+            @param url : the YQL url. Another url can be given to use a local fake provider
+            @param metrics : Metrics instance in which the timings and counters are recorded. None = a new one
+            @param profile_every : profile one polling cycle every N cycles. 0 = no profiling
+            @param profile_directory : directory where the profiling results are stored
+            @param history_size : number of observations kept in memory for each location
+            @param trend_window : duration (in minutes) of the window used to compute the pressure trend
+            @param max_staleness : while a location can't be fetched, its cached data are sent again until they are older than this (in minutes)
+            @param shards : number of worker processes which fetch and decode the locations. 0 = no worker process
+            @param record_filename : file in which the raw responses of Yahoo weather are recorded. None = no recording.
+                                     In sharded mode, each worker process records in its own file (see shard_record_filename())
         """
         self.log = log
         self._callback_sensor_basic = callback_sensor_basic
         self._callback_weather_forecast = callback_weather_forecast
+        self._callback_flush = callback_flush
         self._stop = stop
         self._get_parameter_for_feature = get_parameter_for_feature
+        self._url = url
+        if metrics is None:
+            metrics = Metrics(log)
+        self.metrics = metrics
+        self._profile_every = profile_every
+        self._profile_directory = profile_directory
+        self._max_concurrency = max(1, int(max_concurrency))
+        self._timeout = timeout
+        self._batch_size = max(1, int(batch_size))
+        # the connections to Yahoo weather are kept alive and shared by the fetching threads
+        self._http = HttpClient(connect_timeout = connect_timeout,
+                                read_timeout = timeout,
+                                max_size = int(max_response_size) * 1024,
+                                max_idle = self._max_concurrency)
+        if cache_directory is not None:
+            self._cache = ResponseCache(log, cache_directory, int(cache_ttl) * 60, int(cache_max_size) * 1024)
+        else:
+            self._cache = None
         # the interval is hardcoded as we use an online service
         self._interval = 15 # minutes
+        # each location has its own polling interval, adapted to the provider updates
+        self._scheduler = Scheduler(self._interval * 60, MIN_INTERVAL * 60, MAX_INTERVAL * 60, interval_overrides)
+        # the recent observations, used to compute the values that Yahoo weather does not give
+        self._history = History(max(2, int(history_size)))
+        # the sun informations are computed from the locations positions
+        self._astronomy = Astronomy()
+        # the places of the values in the Yahoo weather data, for the sensors declared in info.json
+        self._extraction = compile_extraction_map()
+        # the dew point, heat index, wind chill and feels like are computed for all the locations at the end of a cycle
+        self._derived = DerivedMetrics()
+        self._trend_window = int(trend_window) * 60
+        self._max_staleness = int(max_staleness) * 60
+        self.metrics.register_gauge("scheduler", self._scheduler.get_stats)
+        # (device, address) of the polled locations, changed by update_devices()
+        self._locations = []
+        # addresses of the polled locations. None until update_devices() is called : all the addresses are accepted
+        self._addresses = None
+        # address => number of other devices of the location (they are not fetched)
+        self._duplicates = {}
+        self._locations_lock = threading.Lock()
+        # set when the devices change, to wake up the polling loop
+        self._wakeup = threading.Event()
+        if int(shards) > 0:
+            # the workers get the options needed to fetch the locations. They are started by start_loop()
+            self._shards = ShardPool(log, int(shards), {'max_concurrency' : self._max_concurrency,
+                                                        'timeout' : timeout,
+                                                        'batch_size' : self._batch_size,
+                                                        'connect_timeout' : connect_timeout,
+                                                        'max_response_size' : max_response_size,
+                                                        'url' : url,
+                                                        'record_filename' : record_filename})
+            self.metrics.register_gauge("shards", self._shards.get_stats)
+        else:
+            self._shards = None
+        if record_filename is not None and self._shards is not None:
+            # the responses are fetched by the workers : each one records them in its own file
+            self._recorder = None
+            self.log.info(u"The Yahoo weather responses are recorded in {0}".format(
+                          u", ".join(shard_record_filename(record_filename, shard) for shard in range(self._shards.num_shards))))
+        elif record_filename is not None:
+            self._recorder = ResponseRecorder(record_filename)
+            self.log.info(u"The Yahoo weather responses are recorded in {0}".format(record_filename))
+        else:
+            self._recorder = None
 
     def start_loop(self, devices):
+        try:
+            self.warm_start(devices)
+        except:
+            self.log.error(u"Error while sending the cached data : {0}".format(traceback.format_exc()))
+        self.start_shards()
+        try:
+            self._loop(devices)
+        finally:
+            self.stop_shards()
+            if self._recorder is not None:
+                self._recorder.close()
+
+    def replay(self, filenames, speed = 0):
+        """ Send the responses of some records files like if they were coming from Yahoo weather.
+            The responses are decoded and sent over xPL by the same code as the live responses.
+            @param filenames : list of records files (see the record_filename option), replayed in the order of the records times
+            @param speed : 1 = at the speed of the recording, 2 = twice faster, ... 0 = as fast as possible
+            @return the number of replayed responses
+        """
+        client = ReplayClient()
+        http = self._http
+        self._http = client
+        num_records = 0
+        start = None
+        try:
+            for timestamp, addresses, body in merge_records(filenames):
+                if self._stop.isSet():
+                    break
+                if start is None:
+                    start = (timestamp, time.time())
+                if speed > 0:
+                    wait = (timestamp - start[0]) / speed - (time.time() - start[1])
+                    if wait > 0:
+                        self._stop.wait(wait)
+                client.body = body
+                for address, observation, error in self._fetch_chunk([({'name' : address}, address) for address in addresses]):
+                    self._process_result(address, observation, error, fetched = True)
+                num_records += 1
+            self._send_derived()
+        finally:
+            self._http = http
+        return num_records
+
+    def start_shards(self):
+        """ Start the worker processes, in sharded mode
+        """
+        if self._shards is not None:
+            self._shards.start()
+
+    def stop_shards(self):
+        """ Stop the worker processes, in sharded mode
+        """
+        if self._shards is not None:
+            self._shards.stop()
+
+    def _loop(self, devices):
+        """ Poll the locations when they are due, until the plugin is stopped
+            @param devices : the devices list
+        """
+        self.update_devices(devices)
+        num_cycles = 0
         while not self._stop.isSet():
-            try:
-                self.get_weather(devices)
-            except:
-                self.log.error(u"Error while call get_weather : {1}".format(traceback.format_exc()))
-            self.log.info(u"Wait for {0} minutes".format(self._interval))
-            self._stop.wait(self._interval*60)
+            next_due = self._scheduler.next_due()
+            due = set(self._scheduler.pop_due())
+            if len(due) > 0:
+                with self._locations_lock:
+                    locations = self._locations
+                    duplicates = self._duplicates
+                start = time.time()
+                self.metrics.record("schedule_lag", start - next_due)
+                num_cycles += 1
+                profile = self._profile_every > 0 and num_cycles % self._profile_every == 0
+                try:
+                    if profile:
+                        self._profile_get_weather([a_device for a_device, address in locations if address in due])
+                    else:
+                        self.get_weather([a_device for a_device, address in locations if address in due])
+                except:
+                    self.log.error(u"Error while call get_weather : {0}".format(traceback.format_exc()))
+                saved = sum(duplicates.get(address, 0) for address in due)
+                if saved > 0:
+                    self.metrics.incr("fetches_saved", saved)
+                # the locations which have not been processed will be retried later
+                self._scheduler.reschedule_pending()
+                self.metrics.record("cycle_time", time.time() - start)
+                self.metrics.incr("cycles")
+            self.metrics.dump_if_needed()
+            next_due = self._scheduler.next_due()
+            if next_due is None:
+                wait = self._interval * 60
+            else:
+                wait = max(0, next_due - time.time())
+            self.log.debug(u"Wait for {0:.0f} seconds".format(wait))
+            self._wait(wait)
+
+    def update_devices(self, devices):
+        """ Change the devices list while the polling loop is running.
+            The new locations are polled as soon as possible, the removed ones are forgotten and
+            the other ones keep their schedule. A polling cycle in progress is not interrupted.
+            @param devices : the new devices list
+            @return (added addresses, removed addresses)
+        """
+        all_locations = self._get_locations(devices)
+        locations = self._unique_locations(all_locations)
+        duplicates = {}
+        for a_device, address in all_locations:
+            duplicates[address] = duplicates.get(address, -1) + 1
+        addresses = [address for a_device, address in locations]
+        with self._locations_lock:
+            old_addresses = set(address for a_device, address in self._locations)
+            self._locations = locations
+            self._addresses = set(addresses)
+            self._duplicates = dict((address, num) for address, num in duplicates.items() if num > 0)
+        added = set(addresses) - old_addresses
+        removed = old_addresses - set(addresses)
+        self._scheduler.set_locations(addresses)
+        for address in removed:
+            self._history.remove(address)
+            self._astronomy.remove(address)
+            if self._cache is not None:
+                self._cache.remove(address)
+        if len(added) > 0 or len(removed) > 0:
+            self.log.info(u"Devices updated : {0} locations added, {1} removed".format(len(added), len(removed)))
+            self.log.debug(u"Locations added : {0}. Locations removed : {1}".format(u", ".join(sorted(added)), u", ".join(sorted(removed))))
+            self._wakeup.set()
+        return added, removed
+
+    def _wait(self, delay):
+        """ Wait until the delay is over, the plugin is stopped or the devices are updated
+            @param delay : maximum time to wait (in seconds)
+        """
+        end = time.time() + delay
+        while not self._stop.isSet() and not self._wakeup.isSet():
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            self._stop.wait(min(remaining, WAKEUP_CHECK_INTERVAL))
+        self._wakeup.clear()
+
+    def warm_start(self, devices):
+        """ Send the cached data of the devices, without waiting for Yahoo weather.
+            The fresh cached data are not sent here as get_weather() will send them without calling Yahoo weather.
+            @param devices : the devices list
+        """
+        if self._cache is None:
+            return
+        for a_device, address in self._unique_locations(self._get_locations(devices)):
+            if self._cache.is_fresh(address):
+                continue
+            cached = self._cache.get(address, max_age = CACHE_WARM_START_MAX_AGE)
+            if cached is None:
+                continue
+            self.log.info(u"Send cached data for {0} ({1})".format(a_device['name'], address))
+            self._process_result(address, self._cached_observation(address, cached[1]), None)
+        self._send_derived()
 
     def get_weather(self, devices):
+        """ Grab the weather informations for all the devices and send them over xPL
+            Each device is processed as soon as its data are available.
+            @param devices : the devices list
+        """
+        all_locations = self._get_locations(devices)
+        unique_locations = self._unique_locations(all_locations)
+        if len(unique_locations) < len(all_locations):
+            self.metrics.incr("fetches_saved", len(all_locations) - len(unique_locations))
+
+        locations = []
+        for a_device, address in unique_locations:
+            # on the first poll after the start, the fresh data from the cache are sent without calling Yahoo weather.
+            # The next polls always call Yahoo weather : the scheduler decides when
+            if self._cache is not None and self._scheduler.is_first_poll(address) and self._cache.is_fresh(address):
+                cached = self._cache.get(address)
+                if cached is not None:
+                    self.log.info(u"Use cached data for {0} ({1})".format(a_device['name'], address))
+                    self._process_result(address, self._cached_observation(address, cached[1]), None)
+                    continue
+            locations.append((a_device, address))
+
+        # several locations can be grabbed in one request to Yahoo weather
+        chunks = [locations[idx:idx+self._batch_size] for idx in range(0, len(locations), self._batch_size)]
+
+        if self._shards is not None:
+            self._get_weather_sharded(locations)
+        elif self._max_concurrency > 1 and len(chunks) > 1:
+            self._get_weather_concurrently(chunks, len(locations))
+        else:
+            for a_chunk in chunks:
+                if self._stop.isSet():
+                    break
+                for address, observation, error in self._fetch_chunk(a_chunk):
+                    self._process_result(address, observation, error, fetched = True)
+        self._send_derived()
+
+    def get_history_stats(self, address, field, window):
+        """ Return the min, max and average of an observed value of a location
+            @param address : the location code (woeid)
+            @param field : pressure, temperature, humidity, wind_speed or wind_direction
+            @param window : duration (in minutes) of the window
+            @return (min, max, average) or None if there are no observations in the window
+        """
+        return self._history.get(address).get_stats(field, window * 60, time.time())
+
+    def get_metrics(self):
+        """ Return a snapshot of the metrics
+        """
+        return self.metrics.snapshot()
+
+    def _profile_get_weather(self, devices):
+        """ Call get_weather() with the profiler on. Only the weather thread is profiled (not the fetching threads)
+            The results are logged and stored in the profile directory.
+            @param devices : the devices list
+        """
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.get_weather(devices)
+        finally:
+            profiler.disable()
+        buf = StringIO()
+        stats = pstats.Stats(profiler, stream = buf)
+        stats.sort_stats("cumulative").print_stats(20)
+        self.log.info(u"Profile of the polling cycle : {0}".format(buf.getvalue()))
+        if self._profile_directory is not None:
+            if not os.path.isdir(self._profile_directory):
+                os.makedirs(self._profile_directory)
+            filename = os.path.join(self._profile_directory, "cycle-{0}.prof".format(time.strftime("%Y%m%d-%H%M%S")))
+            stats.dump_stats(filename)
+            self.log.info(u"Profile of the polling cycle stored in {0}".format(filename))
+
+    def _get_locations(self, devices):
+        """ Return the list of (device, address) for the devices
+            @param devices : the devices list
+        """
+        locations = []
         for a_device in devices:
-            try: 
-                ### Grab data
+            try:
                 # get the device address in the 'current_temperature' sensor. Keep in mind that all the sensors 
                 # for the device type 'weather.weather' has the same address, so we can take the one we want!
                 address = self._get_parameter_for_feature(a_device, "xpl_stats", "current_temperature", "device")
-                self.log.info(u"Start getting weather for {0} ({1})".format(a_device['name'], address))
-
-                # grab weather data
-
-                # More informations here : https://developer.yahoo.com/weather/#get-started
-                # 04/2016 : we do the query in the english metric and convert them manually instead of doing the query in metric system
-                # We do this because yahoo weather was giving badly converted values in metric system
-                query = "select * from weather.forecast where woeid = {0} and u = 'f'".format(address)
-                weather_url = "{0}{1}&format=json".format(YAHOO_WEATHER_URL, query)
-                self.log.debug(u"Url called is {0}".format(weather_url))
-                response = urlopen(weather_url)
-                raw_data = response.read().decode('utf-8')
-                data = json.loads(raw_data)
-                self.log.debug(u"Raw data for {0} : {1}".format(address, data))
-
-                # Check that the location is a good one !
-                # Example of a response to a bad location code : Raw data for BEXX0032 : {u'error': {u'lang': u'en-US', u'description': u'Invalid identfier BEXX0032. me AND me.ip are the only supported identifier in this context'}}
-                if 'error' in data:
-                    self.log.error("Error raised by Yahoo weather : {0}".format(data['error']))
+                locations.append((a_device, address))
+            except:
+                self.log.error(u"Error while getting the location of {0} : {1}".format(a_device['name'], traceback.format_exc()))
+        return locations
+
+    def _unique_locations(self, locations):
+        """ Keep one (device, address) for each address.
+            The xPL messages only contain the address, so the data of a location sent once are received by all
+            the devices of this location.
+            @param locations : list of (device, address)
+        """
+        unique = []
+        names = {}
+        for a_device, address in locations:
+            if address in names:
+                names[address].append(a_device['name'])
+                continue
+            names[address] = [a_device['name']]
+            unique.append((a_device, address))
+        for address in names:
+            if len(names[address]) > 1:
+                self.log.debug(u"Location {0} is shared by the devices {1}".format(address, u", ".join(names[address])))
+        return unique
+
+    def _get_weather_concurrently(self, chunks, num_locations):
+        """ Fetch the chunks of locations with a pool of worker threads.
+            The data are sent over xPL from the calling thread as soon as each location is fetched.
+            @param chunks : list of chunks. A chunk is a list of (device, address)
+            @param num_locations : total number of locations in the chunks
+        """
+        jobs = Queue()
+        results = Queue()
+        for a_chunk in chunks:
+            jobs.put(a_chunk)
+
+        def worker():
+            while not self._stop.isSet():
+                try:
+                    a_chunk = jobs.get_nowait()
+                except Empty:
                     return
+                for a_result in self._fetch_chunk(a_chunk):
+                    results.put(a_result)
+
+        num_workers = min(self._max_concurrency, len(chunks))
+        self.log.debug(u"Fetch {0} locations in {1} requests with {2} workers".format(num_locations, len(chunks), num_workers))
+        for idx in range(num_workers):
+            thr = threading.Thread(None, worker, "weather-fetch-{0}".format(idx), (), {})
+            thr.setDaemon(True)
+            thr.start()
+
+        remaining = num_locations
+        while remaining > 0:
+            try:
+                address, observation, error = results.get(True, 1)
+            except Empty:
+                if self._stop.isSet():
+                    return
+                continue
+            remaining -= 1
+            self._process_result(address, observation, error, fetched = True)
+
+    def _get_weather_sharded(self, locations):
+        """ Give the locations to the worker processes of their shard.
+            The data are sent over xPL from the calling thread as soon as each location is fetched.
+            @param locations : list of (device, address)
+        """
+        by_shard = {}
+        for a_device, address in locations:
+            by_shard.setdefault(shard_of(address, self._shards.num_shards), []).append((a_device, address))
+        for shard, shard_locations in by_shard.items():
+            for idx in range(0, len(shard_locations), self._batch_size):
+                self._shards.dispatch(shard, shard_locations[idx:idx+self._batch_size])
+        self.log.debug(u"Fetch {0} locations with {1} shards".format(len(locations), len(by_shard)))
+
+        remaining = set(address for a_device, address in locations)
+        last_result = time.time()
+        while len(remaining) > 0:
+            if self._stop.isSet():
+                return
+            item = self._shards.get(1)
+            if item is None:
+                self._shards.check()
+                if time.time() - last_result > SHARD_IDLE_TIMEOUTS * self._timeout:
+                    self.log.warning(u"No result from the shards for {0} seconds : {1} locations will be retried later".format(
+                                     SHARD_IDLE_TIMEOUTS * self._timeout, len(remaining)))
+                    return
+                continue
+            last_result = time.time()
+            shard, results = item
+            for address, observation, error in results:
+                # the late results of a previous cycle are sent too
+                remaining.discard(address)
+                self._process_result(address, observation, error, fetched = True)
+
+    def _process_result(self, address, observation, error, fetched = False):
+        """ Send the data of a location or log the error raised while fetching it
+            @param address : the location code (woeid)
+            @param observation : the values of the location, see _observe() (None if an error occured)
+            @param error : (message, True if the error is specific to the location), see _fetch_chunk().
+                           None if the values are available
+            @param fetched : True if the values have just been fetched from Yahoo weather
+        """
+        # a location removed while it was being fetched must not come back
+        with self._locations_lock:
+            removed = self._addresses is not None and address not in self._addresses
+        if removed:
+            self.log.debug(u"Result for the removed location {0} ignored".format(address))
+            return
+        if error is not None:
+            message, location_error = error
+            self.log.error(u"Error while getting data from Yahoo weather : {0}".format(message))
+            self.metrics.incr("errors")
+            # a network or provider failure is only retried later : it must not open the circuit of all the locations
+            failures = self._scheduler.failed(address, location_error)
+            if location_error and failures == CIRCUIT_FAILURES:
+                self.metrics.incr("circuits_opened")
+                self.log.warning(u"{0} failed {1} times in a row : it will be polled again in {2} hours".format(address, failures, CIRCUIT_OPEN_DELAY // 3600))
+            # the sun informations don't need the provider
+            if not self._send_stale(address) and self._send_sun(address):
+                if self._callback_flush is not None:
+                    self._callback_flush(address)
+            return
+        if fetched:
+            try:
+                self._record_history(address, observation)
+            except:
+                self.log.error(u"Error while recording the history of {0} : {1}".format(address, traceback.format_exc()))
+        try:
+            start = time.time()
+            self._send(address, observation)
+            self.metrics.record("publish_time", time.time() - start)
+        except:
+            self.metrics.incr("publish_errors")
+            self.log.error(u"Error while sending data for {0} : {1}".format(address, traceback.format_exc()))
+            self._scheduler.polled(address)
+            return
+        self._scheduler.polled(address, observation['last_build_date'])
+        if fetched and self._cache is not None:
+            try:
+                self._cache.put(address, observation)
+            except:
+                self.log.error(u"Error while caching data for {0} : {1}".format(address, traceback.format_exc()))
 
-
-                ### send current data over xPL
-                cur = data['query']['results']['channel']
-                # current_barometer_value
-                # weather.com # self._callback_sensor_basic(address, "pressure", cur['barometer']['reading'])
-
-                # 04/2016 : dirty fix to fix yahoo issues in celcius...
-                # yahoo convert 1013 inHg to milibar for example but 1013 is already in milibar
-                # so nothing to convert :)
-                self._callback_sensor_basic(address, "pressure", cur['atmosphere']['pressure'])
-
-                # current_barometer_direction
-                # weather.com # self._callback_sensor_basic(address, "barometer_direction", cur['barometer']['direction'])
-                # yahoo weather # N/A
-
-                # current_dewpoint
-                # weather.com # self._callback_sensor_basic(address, "temp_dewpoint", cur['dewpoint'])
-                # yahoo weather # N/A
-
-                # current_feels_like
-                # weather.com # self._callback_sensor_basic(address, "temp_feels_like", cur['feels_like'])
-
-                # 04/2016 : dirty fix to fix yahoo issues in celcius...
-                # yahoo give the value in °F instead of °C
-                self._callback_sensor_basic(address, "temp_feels_like", fahrenheit_to_celcius(cur['wind']['chill']))
-
-                # current_humidity
-                # weather.com # self._callback_sensor_basic(address, "humidity", cur['humidity'])
-                self._callback_sensor_basic(address, "humidity", cur['atmosphere']['humidity'])
-
-                # current_last_updated
-                # weather.com # self._callback_sensor_basic(address, "last_updated", cur['last_updated'])
-                self._callback_sensor_basic(address, "last_updated", cur['lastBuildDate'])
-
-                # current_moon_phase
-                # weather.com # self._callback_sensor_basic(address, "moon_phase", cur['moon_phase']['text'])
-                # yahoo weather # N/A
-
-                # current_station
-                # weather.com # self._callback_sensor_basic(address, "current_station", cur['station'])
-                self._callback_sensor_basic(address, "current_station", "{0} ({1})".format(cur['location']['city'], cur['location']['country']))
-
-                # current_temperature
-                # weather.com # self._callback_sensor_basic(address, "temp", cur['temperature'])
-                self._callback_sensor_basic(address, "temp", fahrenheit_to_celcius(cur['item']['condition']['temp']))
-
-                # current_text
-                # weather.com # self._callback_sensor_basic(address, "text", cur['text'])
-                self._callback_sensor_basic(address, "text", cur['item']['condition']['text'])
-
-                # current_code
-                # weather.com # N/A
-                self._callback_sensor_basic(address, "code", cur['item']['condition']['code'])
-
-                # current_uv
-                # weather.com # self._callback_sensor_basic(address, "uv", cur['uv']['index'])
-                # yahoo weather # N/A
-
-                # current_visibility
-                # weather.com # self._callback_sensor_basic(address, "visibility", cur['visibility'])
-                self._callback_sensor_basic(address, "visibility", mph_to_kmh(cur['atmosphere']['visibility']))
-
-                # current_wind_direction
-                # weather.com # self._callback_sensor_basic(address, "direction", cur['wind']['direction'])
-                self._callback_sensor_basic(address, "direction", cur['wind']['direction'])
-
-                # current_wind_gust
-                # weather.com # self._callback_sensor_basic(address, "speed_gust", cur['wind']['gust'])
-                # yahoo weather # N/A
-
-                # current_wind_speed
-                # weather.com # self._callback_sensor_basic(address, "speed", cur['wind']['speed'])
-                self._callback_sensor_basic(address, "speed", mph_to_kmh(cur['wind']['speed']))
-
-                # current_wind_text
-                # weather.com # self._callback_sensor_basic(address, "wind_text", cur['wind']['text'])
-                # yahoo weather # N/A
-
-                # current_sunset
-                # weather.com # self._callback_sensor_basic(address, "wind_text", cur['wind']['text'])
-                #self._callback_sensor_basic(address, "sunset", cur['astronomy']['sunset'])
-                sunset = cur['astronomy']['sunset']
-                sunset_time = time.strftime("%H:%M:%S", time.strptime(sunset, "%I:%M %p"))
-                self._callback_sensor_basic(address, "sunset", sunset_time)
-
-                # current_sunrise
-                # weather.com # self._callback_sensor_basic(address, "wind_text", cur['wind']['text'])
-                #self._callback_sensor_basic(address, "sunrise", cur['astronomy']['sunrise'])
-                sunrise = cur['astronomy']['sunrise']
-                sunrise_time = time.strftime("%H:%M:%S", time.strptime(sunrise, "%I:%M %p"))
-                self._callback_sensor_basic(address, "sunrise", sunrise_time)
-
-
-                ### send forecast data over xPL
-                day_num = 0
-                for day in data['query']['results']['channel']['item']['forecast']:
-                    print day
-                    data = {'day' : day_num,
-                            'device' : address,
-                            'day-name' : day['day'],
-                            'temperature-high' : fahrenheit_to_celcius(day['high']),
-                            'temperature-low' : fahrenheit_to_celcius(day['low']),
-                            'condition-text' : day['text'],
-                            'condition-code' : day['code']}
-                    self._callback_weather_forecast(data)
-                    day_num += 1
-
-                self.log.info(u"Data successfully sent for {0}".format(address))
+    def _send_stale(self, address):
+        """ Send again the last good data of a location which can't be fetched, if they are not too old.
+            The scheduler is not updated : the location is still retried with its backoff.
+            @param address : the location code (woeid)
+            @return True if the cached data have been sent
+        """
+        if self._cache is None:
+            return False
+        cached = self._cache.get(address, max_age = self._max_staleness)
+        if cached is None:
+            return False
+        self.log.info(u"Send the cached data of {0} ({1:.0f} minutes old)".format(address, (time.time() - cached[0]) / 60))
+        try:
+            self._send(address, self._cached_observation(address, cached[1]))
+            self.metrics.incr("stale_sends")
+            return True
+        except:
+            self.metrics.incr("publish_errors")
+            self.log.error(u"Error while sending the cached data for {0} : {1}".format(address, traceback.format_exc()))
+            return False
+
+    def _send_sun(self, address):
+        """ Send the sun informations of a location over xPL
+            @param address : the location code (woeid)
+            @return True if the location position is known and the informations have been sent
+        """
+        try:
+            sun = self._astronomy.get_sun(address)
+        except:
+            self.log.error(u"Error while computing the sun informations of {0} : {1}".format(address, traceback.format_exc()))
+            return False
+        if sun is None:
+            return False
+        # during the polar day or night, there is no sunrise nor sunset
+        if sun['sunset'] is not None:
+            self._callback_sensor_basic(address, "sunset", sun['sunset'])
+        if sun['sunrise'] is not None:
+            self._callback_sensor_basic(address, "sunrise", sun['sunrise'])
+        self._callback_sensor_basic(address, "day_length", sun['day_length'])
+        self._callback_sensor_basic(address, "sun_elevation", "{0:.1f}".format(sun['elevation']))
+        return True
+
+    def _send_derived(self):
+        """ Compute the derived values of the locations sent since the last call and send them over xPL
+        """
+        if len(self._derived) == 0:
+            return
+        start = time.time()
+        for address, values in self._derived.compute():
+            for w_type in sorted(values):
+                if not math.isnan(values[w_type]):
+                    self._callback_sensor_basic(address, w_type, "{0:.0f}".format(values[w_type]))
+            # flushed for each location, so the publisher queue never holds the values of the whole cycle
+            if self._callback_flush is not None:
+                self._callback_flush(address)
+        self.metrics.record("derived_time", time.time() - start)
+
+    def _record_history(self, address, observation):
+        """ Add the current observation of a location in its history
+            @param address : the location code (woeid)
+            @param observation : the values of the location, see _observe()
+        """
+        numbers = observation['numbers']
+        self._history.get(address).add(time.time(),
+                                       pressure = numbers['pressure'],
+                                       temperature = numbers['temperature'],
+                                       humidity = numbers['humidity'],
+                                       wind_speed = numbers['wind_speed'],
+                                       wind_direction = numbers['wind_direction'])
+
+    def _observe(self, address, data):
+        """ Extract the values used by the plugin from the decoded json data of a location.
+            The observation is much smaller than the json data : it is what the worker processes send back
+            to the plugin process and what is cached.
+            @param address : the location code (woeid)
+            @param data : the decoded json data
+            @return a dict :
+                    - current : list of (xPL type, value) of the sensor.basic messages
+                    - forecasts : list of the weather.forecast messages data
+                    - numbers : values of the history and of the derived values. A missing or invalid value is NaN
+                    - position : [latitude, longitude] or None if it is missing
+                    - sunrise, sunset, last_build_date : the values given by Yahoo weather or None
+        """
+        cur = data['query']['results']['channel']
+        try:
+            position = [float(cur['item']['lat']), float(cur['item']['long'])]
+        except (KeyError, TypeError, ValueError):
+            position = None
+        astronomy = cur.get('astronomy') or {}
+        return {'current' : self._extraction.extract_current(cur),
+                'forecasts' : self._extraction.extract_forecasts(cur, address),
+                'numbers' : {'pressure' : get_number(cur, float, 'atmosphere', 'pressure'),
+                             'temperature' : get_number(cur, fahrenheit_to_celcius, 'item', 'condition', 'temp'),
+                             'temperature_f' : get_number(cur, float, 'item', 'condition', 'temp'),
+                             'humidity' : get_number(cur, float, 'atmosphere', 'humidity'),
+                             'wind_speed' : get_number(cur, mph_to_kmh, 'wind', 'speed'),
+                             'wind_direction' : get_number(cur, float, 'wind', 'direction')},
+                'position' : position,
+                'sunrise' : astronomy.get('sunrise'),
+                'sunset' : astronomy.get('sunset'),
+                'last_build_date' : cur.get('lastBuildDate')}
+
+    def _cached_observation(self, address, cached):
+        """ Return the observation of a cache entry. The entries written by the former versions hold the json data
+            @param address : the location code (woeid)
+            @param cached : the cached data
+        """
+        if 'query' in cached:
+            return self._observe(address, cached)
+        return cached
+
+    def _fetch_chunk(self, chunk):
+        """ Fetch a chunk of locations and extract their values. This function never raises : errors are returned
+            for each location.
+            @param chunk : list of (device, address)
+            @return a list of (address, observation, error). See _observe() for the observation.
+                    The error is None or (message, location_error). location_error is True when the error is
+                    specific to the location (unknown location code, invalid data) and False for a network
+                    or provider failure
+        """
+        for a_device, address in chunk:
+            self.log.info(u"Start getting weather for {0} ({1})".format(a_device['name'], address))
+        addresses = [address for a_device, address in chunk]
+        try:
+            if len(addresses) == 1:
+                fetched = {addresses[0] : self._fetch(addresses[0])}
+            else:
+                fetched = self._fetch_batch(addresses)
+        except WeatherException:
+            # an error of Yahoo weather about the request : it is specific to the location when it is alone
+            error = (traceback.format_exc(), len(addresses) == 1)
+            return [(address, None, error) for address in addresses]
+        except:
+            error = (traceback.format_exc(), False)
+            return [(address, None, error) for address in addresses]
+
+        results = []
+        for address in addresses:
+            if address not in fetched:
+                results.append((address, None, (u"No data returned by Yahoo weather for {0}".format(address), True)))
+                continue
+            try:
+                results.append((address, self._observe(address, fetched[address]), None))
             except:
-                self.log.error(u"Error while getting data from Yahoo weather : {0}".format(traceback.format_exc()))
+                results.append((address, None, (u"Invalid data returned by Yahoo weather for {0} : {1}".format(address, traceback.format_exc()), True)))
+        return results
+
+    def _call_yahoo(self, query, addresses):
+        """ Do a YQL query on Yahoo weather
+            @param query : the YQL query
+            @param addresses : the locations codes of the query (for the responses recording)
+            @return the decoded json data
+        """
+        weather_url = "{0}{1}&format=json".format(self._url, quote(query))
+        self.log.debug(u"Url called is {0}".format(weather_url))
+        start = time.time()
+        try:
+            raw_data = self._http.get(weather_url)
+        except HttpClientException as exc:
+            if exc.status is None:
+                self.metrics.incr("http_failures")
+            else:
+                self.metrics.incr("http_status_{0}".format(exc.status))
+            raise
+        except:
+            self.metrics.incr("http_failures")
+            raise
+        self.metrics.incr("http_status_200")
+        self.metrics.record("fetch_time", time.time() - start)
+        if self._recorder is not None:
+            try:
+                self._recorder.record(time.time(), addresses, raw_data)
+            except:
+                self.log.error(u"Error while recording the response : {0}".format(traceback.format_exc()))
+        start = time.time()
+        data = json.loads(raw_data.decode('utf-8'))
+        self.metrics.record("decode_time", time.time() - start)
+        return data
+
+    def _fetch(self, address):
+        """ Grab the weather data of a location from Yahoo weather
+            @param address : the location code (woeid)
+            @return the decoded json data
+        """
+        # More informations here : https://developer.yahoo.com/weather/#get-started
+        # 04/2016 : we do the query in the english metric and convert them manually instead of doing the query in metric system
+        # We do this because yahoo weather was giving badly converted values in metric system
+        query = "select * from weather.forecast where woeid = {0} and u = 'f'".format(address)
+        data = self._call_yahoo(query, [address])
+        self.log.debug(u"Raw data for {0} : {1}".format(address, data))
+
+        # Check that the location is a good one !
+        # Example of a response to a bad location code : Raw data for BEXX0032 : {u'error': {u'lang': u'en-US', u'description': u'Invalid identfier BEXX0032. me AND me.ip are the only supported identifier in this context'}}
+        if 'error' in data:
+            raise WeatherException(u"Error raised by Yahoo weather for {0} : {1}".format(address, data['error']))
+        return data
+
+    def _fetch_batch(self, addresses):
+        """ Grab the weather data of several locations from Yahoo weather in one request
+            @param addresses : the locations codes (woeid)
+            @return a dict address => decoded json data, in the same format as the one returned by _fetch()
+                    Locations missing from Yahoo answer (an invalid woeid for example) are not in the dict
+        """
+        query = "select * from weather.forecast where woeid in ({0}) and u = 'f'".format(",".join(addresses))
+        data = self._call_yahoo(query, addresses)
+        self.log.debug(u"Raw data for {0} : {1}".format(addresses, data))
+        if 'error' in data:
+            raise WeatherException(u"Error raised by Yahoo weather for {0} : {1}".format(addresses, data['error']))
+
+        results = data['query']['results']
+        if results is None:
+            return {}
+        channels = results['channel']
+        # with only one location in the answer, Yahoo does not return a list
+        if isinstance(channels, dict):
+            channels = [channels]
+
+        # the woeid is not in the channel data, but at the end of the links
+        # Example : http://us.rd.yahoo.com/dailynews/rss/weather/Country__Country/*https://weather.yahoo.com/country/state/city-615702/
+        fetched = {}
+        for a_channel in channels:
+            match = WOEID_IN_LINK.search(a_channel.get('link', ''))
+            if match is None or 'item' not in a_channel:
+                self.log.warning(u"Unexpected location in Yahoo weather answer for {0} : {1}".format(addresses, a_channel))
+                continue
+            fetched[match.group(1)] = {'query' : {'results' : {'channel' : a_channel}}}
+        return fetched
+
+    def _send(self, address, observation):
+        """ Send the weather data of a location over xPL
+            @param address : the location code (woeid)
+            @param observation : the values of the location, see _observe()
+        """
+        ### send current data over xPL
+        # the values given by Yahoo weather : see lib/extraction.py
+        for w_type, value in observation['current']:
+            self._callback_sensor_basic(address, w_type, value)
+
+        # current_barometer_direction
+        # weather.com # self._callback_sensor_basic(address, "barometer_direction", cur['barometer']['direction'])
+        # yahoo weather # N/A : computed from the pressure history
+        trend = self._history.get(address).get_pressure_trend(self._trend_window, time.time())
+        if trend is not None:
+            self._callback_sensor_basic(address, "barometer_direction", trend)
+
+        # current_dewpoint, current_heat_index, current_wind_chill, current_feels_like
+        # weather.com # self._callback_sensor_basic(address, "temp_dewpoint", cur['dewpoint'])
+        # yahoo weather # N/A : computed with the other locations at the end of the cycle
+        numbers = observation['numbers']
+        self._derived.add(address, numbers['temperature_f'], numbers['humidity'], numbers['wind_speed'])
+
+        # current_sunset, current_sunrise, current_day_length, current_sun_elevation
+        # computed from the location position. The yahoo sunrise is only used to learn the location UTC offset
+        if observation['position'] is not None and observation['sunrise'] is not None:
+            self._astronomy.set_location(address, observation['position'][0], observation['position'][1], observation['sunrise'])
+        else:
+            self.log.warning(u"No position for {0} : the sun informations are taken from Yahoo weather".format(address))
+        if not self._send_sun(address):
+            sunset = observation['sunset']
+            sunset_time = time.strftime("%H:%M:%S", time.strptime(sunset, "%I:%M %p"))
+            self._callback_sensor_basic(address, "sunset", sunset_time)
+            sunrise = observation['sunrise']
+            sunrise_time = time.strftime("%H:%M:%S", time.strptime(sunrise, "%I:%M %p"))
+            self._callback_sensor_basic(address, "sunrise", sunrise_time)
+
+        ### send forecast data over xPL
+        for forecast in observation['forecasts']:
+            self.log.debug(u"Forecast for {0} : {1}".format(address, forecast))
+            self._callback_weather_forecast(forecast)
+
+        if self._callback_flush is not None:
+            self._callback_flush(address)
+        self.log.info(u"Data successfully sent for {0}".format(address))
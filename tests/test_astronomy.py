@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Tests of the sun informations (lib/astronomy.py) against published sunrise and sunset times
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python -m unittest discover -s tests
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import unittest
+from datetime import date, datetime
+
+from domogik_packages.plugin_weather.lib import astronomy
+from domogik_packages.plugin_weather.lib.astronomy import Astronomy, sun_times, format_minutes
+
+# name, date, latitude, longitude, UTC offset (minutes), sunrise, sunset (local times, None during the polar day)
+REFERENCES = [("Paris", date(2016, 6, 21), 48.8566, 2.3522, 120, "05:47", "21:58"),
+              ("New York", date(2016, 12, 21), 40.7128, -74.0060, -300, "07:16", "16:32"),
+              ("Sydney", date(2016, 6, 21), -33.8688, 151.2093, 600, "07:00", "16:54"),
+              ("Tromso", date(2016, 6, 21), 69.6492, 18.9553, 120, None, None)]
+# maximum allowed difference (in minutes) with the references
+TOLERANCE = 2
+
+
+def to_minutes(value):
+    hours, minutes = value.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def provider_sunrise(lat, lon, offset):
+    """ The sunrise of today given by the provider for a location (local time, like '7:35 am').
+        The Astronomy objects learn the UTC offset of a location from it
+    """
+    sunrise = sun_times(datetime.utcnow().date(), [(lat, lon)])[0][0]
+    hours, minutes = divmod(int(round(sunrise + offset)) % 1440, 60)
+    return "{0}:{1:02d} {2}".format((hours - 1) % 12 + 1, minutes, "am" if hours < 12 else "pm")
+
+
+def difference(minutes, reference):
+    """ Difference (in minutes) between a local time in minutes and a reference HH:MM, over midnight
+    """
+    return abs((to_minutes(format_minutes(minutes)) - to_minutes(reference) + 720) % 1440 - 720)
+
+
+class SunTimesTestCase(unittest.TestCase):
+
+    def test_references(self):
+        for name, day, lat, lon, offset, sunrise, sunset in REFERENCES:
+            computed = sun_times(day, [(lat, lon)])[0]
+            if sunrise is None:
+                self.assertEqual(computed, (None, 0), name)
+                continue
+            self.assertTrue(difference(computed[0] + offset, sunrise) <= TOLERANCE, name)
+            self.assertTrue(difference(computed[1] + offset, sunset) <= TOLERANCE, name)
+
+    def test_batch(self):
+        positions = [(lat, lon) for name, day, lat, lon, offset, sunrise, sunset in REFERENCES]
+        day = date(2016, 6, 21)
+        self.assertEqual(sun_times(day, positions), [sun_times(day, [position])[0] for position in positions])
+
+    def test_polar_night(self):
+        self.assertEqual(sun_times(date(2016, 12, 21), [(69.6492, 18.9553)]), [(None, None)])
+
+
+class AstronomyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # count the positions computed by the Astronomy objects for the tested date (not for the UTC offsets)
+        self.computed = []
+        self._sun_times = astronomy.sun_times
+
+        def counting_sun_times(day, positions):
+            if day == date(2016, 6, 21):
+                self.computed.append(len(positions))
+            return self._sun_times(day, positions)
+        astronomy.sun_times = counting_sun_times
+
+    def tearDown(self):
+        astronomy.sun_times = self._sun_times
+
+    def test_get_sun(self):
+        sun = Astronomy()
+        self.assertEqual(sun.get_sun("615702"), None)
+        sun.set_location("615702", 48.8566, 2.3522, provider_sunrise(48.8566, 2.3522, 120))
+        result = sun.get_sun("615702", datetime(2016, 6, 21, 10))
+        self.assertTrue(difference(to_minutes(result['sunrise']), "05:47") <= TOLERANCE)
+        self.assertTrue(difference(to_minutes(result['sunset']), "21:58") <= TOLERANCE)
+        self.assertTrue(abs(result['day_length'] - (to_minutes("21:58") - to_minutes("05:47"))) <= 2 * TOLERANCE)
+        self.assertTrue(result['elevation'] > 50)
+
+    def test_new_locations_computed_alone(self):
+        sun = Astronomy()
+        now = datetime(2016, 6, 21, 10)
+        for idx in range(100):
+            sun.set_location(str(idx), 45 + idx * 0.1, idx * 0.1, provider_sunrise(45 + idx * 0.1, idx * 0.1, 60))
+        sun.get_sun("0", now)
+        # a new date : all the known locations in one batch
+        self.assertEqual(self.computed[-1], 100)
+        for idx in range(100, 200):
+            sun.set_location(str(idx), 45, idx * 0.1, provider_sunrise(45, idx * 0.1, 60))
+            sun.get_sun(str(idx), now)
+        # the locations added later are computed alone, the other ones are not computed again
+        self.assertEqual(sum(self.computed), 200)
+        for idx in range(200):
+            sun.get_sun(str(idx), now)
+        self.assertEqual(sum(self.computed), 200)
+
+    def test_moved_location(self):
+        sun = Astronomy()
+        now = datetime(2016, 6, 21, 10)
+        sun.set_location("1", 48.8566, 2.3522, provider_sunrise(48.8566, 2.3522, 120))
+        paris = sun.get_sun("1", now)
+        sun.set_location("1", 69.6492, 18.9553, provider_sunrise(69.6492, 18.9553, 120))
+        tromso = sun.get_sun("1", now)
+        self.assertNotEqual(paris['sunrise'], None)
+        self.assertEqual(tromso['sunrise'], None)
+        self.assertEqual(tromso['day_length'], 1440)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Tests of the responses cache (lib/cache.py)
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python -m unittest discover -s tests
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from domogik_packages.plugin_weather.lib import cache
+from domogik_packages.plugin_weather.lib.cache import ResponseCache
+
+DATA = {'current' : [["temp", "10"], ["humidity", "50"]], 'last_build_date' : "Sat, 10 Sep 2016 04:00 PM CEST"}
+
+
+class FakeTime:
+    """ Replace the time module of lib/cache.py, to move the clock
+    """
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.log = logging.getLogger("test_cache")
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeTime()
+        self._time = cache.time
+        cache.time = self.clock
+
+    def tearDown(self):
+        cache.time = self._time
+        shutil.rmtree(self.directory)
+
+    def make_cache(self, ttl = 600, max_size = 1024 * 1024):
+        return ResponseCache(self.log, self.directory, ttl, max_size)
+
+    def entry_size(self):
+        """ Size of the file of an entry with DATA
+        """
+        return len(json.dumps({'address' : "615702", 'timestamp' : self.clock.now, 'data' : DATA}))
+
+    def test_put_and_get(self):
+        responses = self.make_cache()
+        self.assertEqual(responses.get("615702"), None)
+        responses.put("615702", DATA)
+        timestamp, data = responses.get("615702")
+        self.assertEqual(data, DATA)
+        self.assertEqual(timestamp, self.clock.now)
+        # the entries are found again by a new cache
+        self.assertEqual(self.make_cache().get("615702")[1], DATA)
+
+    def test_fresh_and_max_age(self):
+        responses = self.make_cache(ttl = 600)
+        responses.put("615702", DATA)
+        self.assertTrue(responses.is_fresh("615702"))
+        self.assertFalse(responses.is_fresh("2459115"))
+        self.clock.now += 601
+        self.assertFalse(responses.is_fresh("615702"))
+        self.assertEqual(responses.get("615702", max_age = 600), None)
+        self.assertEqual(responses.get("615702", max_age = 700)[1], DATA)
+
+    def test_atomic_write(self):
+        responses = self.make_cache()
+        responses.put("615702", DATA)
+
+        def failing_rename(source, destination):
+            raise OSError("disk full")
+        rename = cache.os.rename
+        cache.os.rename = failing_rename
+        try:
+            self.assertRaises(OSError, responses.put, "615702", {'other' : 1})
+        finally:
+            cache.os.rename = rename
+        # the former entry is intact and the temporary file is removed
+        self.assertEqual(responses.get("615702")[1], DATA)
+        self.assertEqual(os.listdir(self.directory), ["615702.json"])
+
+    def test_eviction_order(self):
+        size = self.entry_size()
+        responses = self.make_cache(max_size = 3 * size)
+        for address in ("615702", "2459115", "12345"):
+            responses.put(address, DATA)
+            self.clock.now += 1
+        # an entry written again is the newest one
+        responses.put("615702", DATA)
+        self.clock.now += 1
+        responses.put("67890", DATA)
+        self.assertEqual(sorted(responses.addresses()), ["12345", "615702", "67890"])
+        self.assertEqual(responses.get("2459115"), None)
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        # a removed entry is not counted anymore
+        responses.remove("12345")
+        responses.put("11111", DATA)
+        self.assertEqual(sorted(responses.addresses()), ["11111", "615702", "67890"])
+
+    def test_eviction_order_after_restart(self):
+        size = self.entry_size()
+        responses = self.make_cache()
+        for address in ("615702", "2459115", "12345"):
+            responses.put(address, DATA)
+            self.clock.now += 1
+        responses.put("615702", DATA)
+        # the oldest entries are removed when the cache starts with a smaller limit
+        responses = self.make_cache(max_size = 2 * size)
+        self.assertEqual(sorted(responses.addresses()), ["12345", "615702"])
+
+    def test_cleanup_at_start(self):
+        responses = self.make_cache()
+        responses.put("615702", DATA)
+        with open(os.path.join(self.directory, "tmpabcd.tmp"), "w") as fp:
+            fp.write("{\"address\" : ")
+        with open(os.path.join(self.directory, "2459115.json"), "w") as fp:
+            fp.write("not json")
+        responses = self.make_cache()
+        self.assertEqual(responses.addresses(), ["615702"])
+        self.assertEqual(os.listdir(self.directory), ["615702.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
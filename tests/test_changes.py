@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Tests of the sending of the changed values only (lib/changes.py), with the messages queued in a
+BatchPublisher like the plugin does (bin/weather.py)
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python -m unittest discover -s tests
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import logging
+import threading
+import unittest
+
+from domogik_packages.plugin_weather.lib.changes import ChangeFilter, check_heartbeat, get_sensor_timeout
+from domogik_packages.plugin_weather.lib.publisher import BatchPublisher
+from domogik_packages.plugin_weather.lib.weather import MAX_INTERVAL
+
+HEARTBEAT = 3600
+
+
+class ChangeFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.log = logging.getLogger("test_changes")
+        self.stop = threading.Event()
+        self.sent = []
+        self.changes = ChangeFilter(HEARTBEAT)
+        self.make_publisher()
+
+    def make_publisher(self, **options):
+        options.setdefault('max_rate', 0)
+        self.publisher = BatchPublisher(self.log, self.sent.append, self.stop, **options)
+
+    def send(self, w_type, value, now):
+        """ Like WeatherManager.send_xpl_sensor_basic() : the value is recorded when the message is sent
+        """
+        if self.changes.is_unchanged("615702", w_type, value, now):
+            return
+        self.publisher.queue((w_type, value), lambda: self.changes.sent("615702", w_type, value, now))
+
+    def poll(self, values, now):
+        """ Send the values of a poll
+            @return the messages sent
+        """
+        del self.sent[:]
+        for w_type, value in values:
+            self.send(w_type, value, now)
+        self.publisher.flush()
+        return self.sent[:]
+
+    def test_unchanged_values(self):
+        self.assertEqual(self.poll([("temp", "10"), ("humidity", "50")], 0), [("temp", "10"), ("humidity", "50")])
+        self.assertEqual(self.poll([("temp", "10"), ("humidity", "50")], 900), [])
+        self.assertEqual(self.poll([("temp", "11"), ("humidity", "50")], 1800), [("temp", "11")])
+        # a value back to a former one is a change
+        self.assertEqual(self.poll([("temp", "10"), ("humidity", "50")], 2700), [("temp", "10")])
+
+    def test_heartbeat(self):
+        self.poll([("temp", "10"), ("humidity", "50")], 0)
+        self.poll([("temp", "11"), ("humidity", "50")], 1800)
+        # the heartbeat delay is counted from the last send of each value
+        self.assertEqual(self.poll([("temp", "11"), ("humidity", "50")], HEARTBEAT), [("humidity", "50")])
+        self.assertEqual(self.poll([("temp", "11"), ("humidity", "50")], HEARTBEAT + 1800), [("temp", "11")])
+        self.assertEqual(self.poll([("temp", "11"), ("humidity", "50")], HEARTBEAT + 2700), [])
+
+    def test_dropped_messages(self):
+        # the oldest message is dropped when the queue is full : its value is sent on the next poll
+        self.make_publisher(max_queue = 1)
+        self.assertEqual(self.poll([("temp", "10"), ("humidity", "50")], 0), [("humidity", "50")])
+        self.assertEqual(self.poll([("temp", "10")], 900), [("temp", "10")])
+        # the plugin stops while the burst is throttled : the values not sent are not recorded
+        self.make_publisher(max_rate = 1)
+        self.stop.set()
+        self.assertEqual(self.poll([("temp", "12"), ("humidity", "52")], 1800), [("temp", "12")])
+        self.assertEqual(self.publisher.dropped, 1)
+        self.assertFalse(self.changes.is_unchanged("615702", "humidity", "52", 1800))
+        self.assertTrue(self.changes.is_unchanged("615702", "temp", "12", 1800))
+
+    def test_forget(self):
+        self.poll([("temp", "10")], 0)
+        self.changes.forget(["2459115"])
+        self.assertTrue(self.changes.is_unchanged("615702", "temp", "10", 900))
+        self.changes.forget(["615702"])
+        self.assertFalse(self.changes.is_unchanged("615702", "temp", "10", 900))
+
+    def test_check_heartbeat(self):
+        timeout = get_sensor_timeout()
+        self.assertEqual(timeout, 86400)
+        self.assertEqual(check_heartbeat(self.log, 720 * 60), 720 * 60)
+        # an unchanged value must be sent again before the timeout, after a poll which can come MAX_INTERVAL later
+        self.assertEqual(check_heartbeat(self.log, timeout), timeout - MAX_INTERVAL * 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
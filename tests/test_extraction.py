@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Tests of the extraction tables (lib/extraction.py) against the former hand written extraction
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python -m unittest discover -s tests
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import unittest
+
+from domogik_packages.plugin_weather.lib.extraction import compile_extraction_map, mph_to_kmh, fahrenheit_to_celcius
+from domogik_packages.plugin_weather.lib.fake_provider import make_channel
+
+
+def hand_written(cur, address):
+    """ The extraction as it was written in lib/weather.py before the extraction tables.
+        The feels like temperature is now computed (lib/derived.py) and is not extracted anymore
+    """
+    values = [("pressure", cur['atmosphere']['pressure']),
+              ("humidity", cur['atmosphere']['humidity']),
+              ("last_updated", cur['lastBuildDate']),
+              ("current_station", "{0} ({1})".format(cur['location']['city'], cur['location']['country'])),
+              ("temp", fahrenheit_to_celcius(cur['item']['condition']['temp'])),
+              ("text", cur['item']['condition']['text']),
+              ("code", cur['item']['condition']['code']),
+              ("visibility", mph_to_kmh(cur['atmosphere']['visibility'])),
+              ("direction", cur['wind']['direction']),
+              ("speed", mph_to_kmh(cur['wind']['speed']))]
+    forecasts = []
+    day_num = 0
+    for day in cur['item']['forecast']:
+        forecasts.append({'day' : day_num,
+                          'device' : address,
+                          'day-name' : day['day'],
+                          'temperature-high' : fahrenheit_to_celcius(day['high']),
+                          'temperature-low' : fahrenheit_to_celcius(day['low']),
+                          'condition-text' : day['text'],
+                          'condition-code' : day['code']})
+        day_num += 1
+    return values, forecasts
+
+
+class ExtractionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.extraction = compile_extraction_map()
+
+    def test_same_as_hand_written(self):
+        for address in ("615702", "2459115", "1000042"):
+            channel = make_channel(address)
+            values, forecasts = hand_written(channel, address)
+            self.assertEqual(sorted(self.extraction.extract_current(channel)), sorted(values))
+            # only the forecast days declared in info.json are sent
+            self.assertEqual(self.extraction.forecast_days, 5)
+            self.assertEqual(self.extraction.extract_forecasts(channel, address), forecasts[:5])
+
+    def test_types(self):
+        values, forecasts = hand_written(make_channel("615702"), "615702")
+        self.assertEqual(sorted(self.extraction.get_types()), sorted(w_type for w_type, value in values))
+
+    def test_missing_values(self):
+        channel = make_channel("615702")
+        del channel['wind']
+        channel['atmosphere']['visibility'] = "unknown"
+        del channel['item']['forecast'][1]['high']
+        types = [w_type for w_type, value in self.extraction.extract_current(channel)]
+        self.assertEqual(sorted(types), sorted(set(self.extraction.get_types()) - set(["direction", "speed", "visibility"])))
+        forecasts = self.extraction.extract_forecasts(channel, "615702")
+        self.assertEqual(len(forecasts), 5)
+        self.assertFalse('temperature-high' in forecasts[1])
+        self.assertTrue('temperature-low' in forecasts[1])
+        del channel['item']
+        self.assertEqual(self.extraction.extract_forecasts(channel, "615702"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
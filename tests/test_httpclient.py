@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Tests of the http client (lib/httpclient.py) against the local fake provider
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python -m unittest discover -s tests
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import json
+import socket
+import time
+import unittest
+import zlib
+# python 2 and 3
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+from domogik_packages.plugin_weather.lib import fake_provider
+from domogik_packages.plugin_weather.lib.httpclient import HttpClient, HttpClientException, DeflateDecoder
+from domogik_packages.plugin_weather.lib.fake_provider import FakeProvider
+
+
+class MaxLatency:
+    """ Replace the random module of lib/fake_provider.py : each response has twice the average latency, without error
+    """
+
+    def uniform(self, low, high):
+        return high
+
+    def random(self):
+        return 1.0
+
+
+class HttpClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = FakeProvider(padding = 10000, invalid_woeids = ["BAD"])
+        self.provider.start()
+        self.client = HttpClient(connect_timeout = 5, read_timeout = 5)
+
+    def tearDown(self):
+        self.client.close()
+        self.provider.stop()
+
+    def get_url(self, woeid):
+        query = "select * from weather.forecast where woeid = {0} and u = 'f'".format(woeid)
+        return "{0}{1}&format=json".format(self.provider.get_url(), quote(query))
+
+    def test_connection_reused(self):
+        for idx in range(10):
+            self.client.get(self.get_url("615702"))
+        self.assertEqual(self.provider.requests, 10)
+        self.assertEqual(self.client.requests_done, 10)
+        self.assertEqual(self.client.connections_opened, 1)
+
+    def test_gzip_response(self):
+        body = self.client.get(self.get_url("615702"))
+        data = json.loads(body.decode("utf-8"))
+        self.assertEqual(self.provider.gzip_responses, 1)
+        self.assertTrue(data['query']['results']['channel']['link'].endswith("-615702/"))
+        # the padding is compressed by the provider and restored by the client
+        self.assertTrue(len(body) > 10000)
+
+    def test_response_too_big(self):
+        client = HttpClient(connect_timeout = 5, read_timeout = 5, max_size = 5000)
+        try:
+            self.assertRaises(HttpClientException, client.get, self.get_url("615702"))
+        finally:
+            client.close()
+
+    def test_http_error(self):
+        self.provider.error_rate = 1
+        try:
+            self.client.get(self.get_url("615702"))
+            self.fail("No exception raised")
+        except HttpClientException as exc:
+            self.assertEqual(exc.status, 500)
+        # the connection is still usable after an error
+        self.provider.error_rate = 0
+        self.client.get(self.get_url("615702"))
+        self.assertEqual(self.client.connections_opened, 1)
+
+    def test_idle_connection_closed(self):
+        # the server closes the idle connections : the request is sent again on a new connection
+        self.provider.stop()
+        self.provider = FakeProvider(idle_timeout = 0.2)
+        self.provider.start()
+        self.client.get(self.get_url("615702"))
+        time.sleep(0.5)
+        self.client.get(self.get_url("615702"))
+        self.assertEqual(self.provider.requests, 2)
+        self.assertEqual(self.client.requests_done, 2)
+        self.assertEqual(self.client.connections_opened, 2)
+
+    def test_timeout_not_retried(self):
+        # a timeout on a reused connection is not a closed connection : the request is not sent again
+        client = HttpClient(connect_timeout = 5, read_timeout = 0.2)
+        client.get(self.get_url("615702"))
+        self.provider.latency = 0.5
+        provider_random = fake_provider.random
+        fake_provider.random = MaxLatency()
+        try:
+            self.assertRaises(socket.timeout, client.get, self.get_url("615702"))
+        finally:
+            fake_provider.random = provider_random
+            client.close()
+        self.assertEqual(self.provider.requests, 2)
+        self.assertEqual(client.connections_opened, 1)
+
+
+class DeflateDecoderTestCase(unittest.TestCase):
+
+    def test_zlib_and_raw_deflate(self):
+        data = b"weather " * 1000
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        raw_deflate = compressor.compress(data) + compressor.flush()
+        for compressed in (zlib.compress(data), raw_deflate):
+            decoder = DeflateDecoder()
+            self.assertEqual(decoder.decompress(compressed) + decoder.flush(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
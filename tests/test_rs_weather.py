@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Tests of the butler part (lib/rs_weather.py) : the answers must be the ones of the butler lookup
+(get_sensor_value) on the full devices list, whatever the index finds
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python -m unittest discover -s tests
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import unittest
+
+from domogik_packages.plugin_weather.lib import rs_weather
+
+CFG_I18N = {'locale' : "fr_FR",
+            'condition_text_list' : dict((code, u"condition {0}".format(code)) for code in range(48)),
+            'days_absolute' : {},
+            'days_relative' : {u"aujourd'hui" : 0, u"demain" : 1},
+            'ERROR_UNKNOWN_DAY' : u"jour inconnu",
+            'ERROR_UNKNOWN_LOCATION' : u"lieu inconnu",
+            'SEPARATOR' : u"__SEP__",
+            'TXT_IN_LOCATION' : u"à {0}, ",
+            'TXT_CURRENT_TEMPERATURE' : u", il fait {0}",
+            'TXT_CONDITION_AND_TEMPERATURES' : u"{0}, de {1} à {2}",
+            'TXT_TEMPERATURE' : u"il fait {0}"}
+
+
+def make_device(name, temperature, data_type = "DT_Temp"):
+    """ A weather device with the forecast sensors, like in the butler memory
+    """
+    sensors = {}
+    for day in range(5):
+        for reference, value, a_type in (("temperature_high", temperature + 5, "DT_Temp"),
+                                          ("temperature_low", temperature - 5, "DT_Temp"),
+                                          ("condition_code", 30, "DT_String")):
+            reference = "forecast_{0}_{1}".format(day, reference)
+            sensors[reference] = {'reference' : reference, 'last_value' : value, 'data_type' : a_type}
+    sensors['current_temperature'] = {'reference' : "current_temperature", 'last_value' : temperature, 'data_type' : data_type}
+    return {'name' : name, 'sensors' : sensors}
+
+
+def butler_lookup(log, devices, locale, data_type, device_name = None, reference = None):
+    """ A lookup with its own rules (exact name, data type and formatted value) : the answers must follow them
+    """
+    for a_device in devices:
+        if device_name is not None and a_device['name'] != device_name:
+            continue
+        for a_sensor in a_device['sensors'].values():
+            if a_sensor['reference'] == reference and a_sensor['data_type'] == data_type:
+                if data_type == "DT_Temp":
+                    return u"{0} ({1})".format(a_sensor['last_value'], locale)
+                return a_sensor['last_value']
+    return None
+
+
+class RsWeatherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._get_sensor_value = rs_weather.get_sensor_value
+        self._devices_signature = rs_weather.devices_signature
+        self.signatures = [0]
+
+        def counting_signature(devices):
+            self.signatures[0] += 1
+            return self._devices_signature(devices)
+        rs_weather.get_sensor_value = butler_lookup
+        rs_weather.devices_signature = counting_signature
+        rs_weather.SENSOR_INDEX = rs_weather.SensorIndex()
+        self.devices = [make_device(u"Paris", 15), make_device(u"Lyon", 20), make_device(u"Saint-Étienne", 12)]
+
+    def tearDown(self):
+        rs_weather.get_sensor_value = self._get_sensor_value
+        rs_weather.devices_signature = self._devices_signature
+        rs_weather.SENSOR_INDEX = rs_weather.SensorIndex()
+
+    def temperature(self, name):
+        return rs_weather.get_temperature(CFG_I18N, name.split(), None, self.devices)
+
+    def test_answers_of_the_butler_lookup(self):
+        self.assertEqual(self.temperature(u"Paris"), u"à Paris, il fait 15 (fr_FR)")
+        # the spoken name is resolved to the device name
+        self.assertEqual(self.temperature(u"saint etienne"), u"à Saint-Étienne, il fait 12 (fr_FR)")
+        self.assertEqual(rs_weather.get_forecast(CFG_I18N, [u"demain__SEP__lyon"], None, self.devices),
+                         u"demain, à Lyon, condition 30, de 15 (fr_FR) à 25 (fr_FR)")
+        # a sensor with another data type is not found by the butler lookup, even if the index knows its device
+        self.devices.append(make_device(u"Nice", 25, data_type = "DT_Number"))
+        self.assertEqual(self.temperature(u"Nice"), u"lieu inconnu")
+        self.assertEqual(self.temperature(u"Nowhere"), u"lieu inconnu")
+
+    def test_refreshed_once_per_question(self):
+        self.temperature(u"Paris")
+        built = self.signatures[0]
+        for idx in range(10):
+            self.temperature(u"Lyon")
+            rs_weather.get_forecast(CFG_I18N, [u"0__SEP__Paris"], None, self.devices)
+        # the devices did not change : no pass over the devices
+        self.assertEqual(self.signatures[0], built)
+
+    def test_changed_devices(self):
+        self.assertEqual(self.temperature(u"Paris"), u"à Paris, il fait 15 (fr_FR)")
+        # a device replaced in the same list
+        self.devices[0] = make_device(u"Paris", 30)
+        self.assertEqual(self.temperature(u"Paris"), u"à Paris, il fait 30 (fr_FR)")
+        # a device renamed in place
+        self.devices[0]['name'] = u"Marseille"
+        self.assertEqual(self.temperature(u"Paris"), u"lieu inconnu")
+        self.assertEqual(self.temperature(u"Marseille"), u"à Marseille, il fait 30 (fr_FR)")
+        # a new devices list
+        self.devices = [make_device(u"Paris", 5)]
+        self.assertEqual(self.temperature(u"Paris"), u"à Paris, il fait 5 (fr_FR)")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Tests of the polling scheduler (lib/scheduler.py). The jitter is disabled to get exact due times
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python -m unittest discover -s tests
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import unittest
+
+from domogik_packages.plugin_weather.lib import scheduler
+from domogik_packages.plugin_weather.lib.scheduler import Scheduler, UPDATE_MARGIN, parse_interval_overrides
+
+DATE_1600 = "Sat, 10 Sep 2016 04:00 PM CEST"
+DATE_1630 = "Sat, 10 Sep 2016 04:30 PM CEST"
+
+
+class NoJitter:
+    """ Replace the random module of lib/scheduler.py
+    """
+
+    def uniform(self, low, high):
+        return 0
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._random = scheduler.random
+        scheduler.random = NoJitter()
+
+    def tearDown(self):
+        scheduler.random = self._random
+
+    def make_scheduler(self, addresses, interval = 1200, overrides = None):
+        """ A scheduler with the locations due at time 0, and polled once (their phase is applied)
+        """
+        a_scheduler = Scheduler(interval, 300, 3600, overrides)
+        a_scheduler.set_locations(addresses, now = 0)
+        self.assertEqual(sorted(a_scheduler.pop_due(now = 0)), sorted(addresses))
+        for address in addresses:
+            a_scheduler.polled(address, DATE_1600, now = 0)
+        return a_scheduler
+
+    def poll(self, a_scheduler, last_build_date):
+        """ Poll the next due locations
+            @return the time of the poll
+        """
+        now = a_scheduler.next_due()
+        for address in a_scheduler.pop_due(now):
+            a_scheduler.polled(address, last_build_date, now)
+        return now
+
+    def test_phase_spreading(self):
+        addresses = ["615702", "2459115", "12345", "67890"]
+        a_scheduler = self.make_scheduler(addresses)
+        due = []
+        while a_scheduler.next_due() < 2400:
+            now = a_scheduler.next_due()
+            for address in a_scheduler.pop_due(now):
+                due.append((now, address))
+                a_scheduler.polled(address, DATE_1600, now)
+        # the first polls are spread over the interval, the next ones keep the spreading
+        self.assertEqual(due[:4], [(1200, "615702"), (1500, "2459115"), (1800, "12345"), (2100, "67890")])
+        self.assertEqual(due[4:], [])
+        self.assertEqual(a_scheduler.next_due(), 1200 + 1800)
+
+    def test_backoff_on_unchanged_data(self):
+        a_scheduler = self.make_scheduler(["615702"])
+        self.assertEqual(a_scheduler.get_interval("615702"), 1200)
+        intervals = []
+        for idx in range(4):
+            self.poll(a_scheduler, DATE_1600)
+            intervals.append(a_scheduler.get_interval("615702"))
+        self.assertEqual(intervals, [1800, 2700, 3600, 3600])
+        # new data : back to the base interval
+        self.poll(a_scheduler, DATE_1630)
+        self.assertEqual(a_scheduler.get_interval("615702"), 1200)
+
+    def test_provider_period(self):
+        a_scheduler = Scheduler(3600, 300, 7200)
+        a_scheduler.set_locations(["615702"], now = 0)
+        a_scheduler.pop_due(now = 0)
+        a_scheduler.polled("615702", DATE_1600, now = 0)
+        self.assertEqual(self.poll(a_scheduler, DATE_1630), 3600)
+        # the provider updates every 30 minutes : polled just after the next update instead of the interval
+        self.assertEqual(a_scheduler.next_due(), 3600 + 1800 + UPDATE_MARGIN)
+        # no update : the interval backs off but the next expected update comes first
+        now = self.poll(a_scheduler, DATE_1630)
+        self.assertEqual(a_scheduler.get_interval("615702"), 5400)
+        self.assertEqual(a_scheduler.next_due(), now + 1800)
+
+    def test_overrides(self):
+        overrides = parse_interval_overrides("615702=10, 2459115 = 90,")
+        self.assertEqual(overrides, {"615702" : 600, "2459115" : 5400})
+        a_scheduler = self.make_scheduler(["12345", "615702"], overrides = overrides)
+        self.assertEqual(a_scheduler.get_interval("615702"), 600)
+        # the interval of an overridden location does not back off
+        for idx in range(6):
+            self.poll(a_scheduler, DATE_1600)
+        self.assertEqual(a_scheduler.get_interval("615702"), 600)
+        self.assertTrue(a_scheduler.get_interval("12345") > 1200)
+
+    def test_reschedule_pending(self):
+        a_scheduler = self.make_scheduler(["615702", "2459115"])
+        self.assertEqual(a_scheduler.pop_due(now = 2000), ["615702", "2459115"])
+        self.assertEqual(a_scheduler.next_due(), None)
+        # the popped locations which were not polled (plugin stopped for example) are due again after their interval
+        a_scheduler.reschedule_pending(now = 2000)
+        self.assertEqual(a_scheduler.next_due(), 2000 + 1200)
+        self.assertEqual(sorted(a_scheduler.pop_due(now = 3200)), ["2459115", "615702"])
+
+    def test_stale_entries(self):
+        a_scheduler = self.make_scheduler(["615702", "2459115"])
+        # a location rescheduled while it was already queued : its former due time is ignored
+        a_scheduler.polled("615702", DATE_1600, now = 500)
+        self.assertEqual(a_scheduler.pop_due(now = 1200), [])
+        self.assertEqual(a_scheduler.pop_due(now = 1800), ["2459115"])
+        self.assertEqual(a_scheduler.next_due(), 500 + 1800)
+        a_scheduler.polled("2459115", DATE_1600, now = 1800)
+        # a removed location is not returned anymore
+        a_scheduler.set_locations(["2459115"], now = 1300)
+        self.assertEqual(a_scheduler.pop_due(now = 3600), ["2459115"])
+        a_scheduler.polled("615702", DATE_1600, now = 3600)
+        self.assertEqual(a_scheduler.next_due(), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
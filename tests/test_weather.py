@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+""" This file is part of B{Domogik} project (U{http://www.domogik.org}).
+
+License
+=======
+
+B{Domogik} is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+B{Domogik} is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Domogik. If not, see U{http://www.gnu.org/licenses}.
+
+Plugin purpose
+==============
+
+Tests of the polling (lib/weather.py) against the local fake provider, with the xPL messages
+queued in a BatchPublisher like the plugin does
+
+Usage (like start.sh) :
+    export PYTHONPATH=/var/lib/domogik && python -m unittest discover -s tests
+
+@author: Fritz <fritz.smh@gmail.com>
+@copyright: (C) 2007-2016 Domogik project
+@license: GPL(v3)
+@organization: Domogik
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from domogik_packages.plugin_weather.lib.weather import Weather, MAX_INTERVAL
+from domogik_packages.plugin_weather.lib.scheduler import CIRCUIT_FAILURES
+from domogik_packages.plugin_weather.lib.publisher import BatchPublisher
+from domogik_packages.plugin_weather.lib.fake_provider import FakeProvider
+from domogik_packages.plugin_weather.lib.recorder import read_records
+from domogik_packages.plugin_weather.lib.shards import shard_record_filename
+
+
+class WeatherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.log = logging.getLogger("test_weather")
+        self.provider = FakeProvider()
+        self.provider.start()
+        self.stop = threading.Event()
+        self.sent = []
+        # the messages are sent without rate limit
+        self.publisher = BatchPublisher(self.log, self.sent.append, self.stop, max_rate = 0)
+
+    def tearDown(self):
+        self.stop.set()
+        self.provider.stop()
+
+    def use_provider(self, **options):
+        """ Replace the fake provider by one with other options
+        """
+        self.provider.stop()
+        self.provider = FakeProvider(**options)
+        self.provider.start()
+
+    def make_weather(self, **options):
+        def callback_sensor_basic(w_device, w_type, w_value):
+            self.publisher.queue((w_device, w_type, w_value))
+
+        def callback_weather_forecast(data):
+            self.publisher.queue(("forecast", data['device'], data['day']))
+
+        def get_parameter_for_feature(a_device, xpl_stats, sensor, key):
+            return a_device['address']
+
+        options.setdefault('batch_size', 50)
+        return Weather(self.log, callback_sensor_basic, callback_weather_forecast, self.stop, get_parameter_for_feature,
+                       callback_flush = lambda address: self.publisher.flush(), url = self.provider.get_url(), **options)
+
+    def make_devices(self, number):
+        return [{'name' : "City {0}".format(idx), 'address' : str(1000000 + idx)} for idx in range(number)]
+
+    def test_no_message_dropped(self):
+        # more locations than the publisher queue can hold with their derived values
+        devices = self.make_devices(400)
+        weather = self.make_weather()
+        weather.get_weather(devices)
+        self.assertEqual(self.publisher.dropped, 0)
+        for w_type in ("temp_dewpoint", "temp_heat_index", "temp_wind_chill", "temp_feels_like"):
+            self.assertEqual(len([msg for msg in self.sent if msg[1] == w_type]), len(devices))
+
+    def sent_temperatures(self):
+        return sorted(msg[0] for msg in self.sent if msg[1] == "temp")
+
+    def test_provider_outage(self):
+        # an outage of the provider does not open the circuits : the locations are retried with a backoff
+        # capped by the maximum interval and their cached values are sent again
+        self.use_provider(error_rate = 0)
+        directory = tempfile.mkdtemp()
+        try:
+            devices = self.make_devices(3)
+            weather = self.make_weather(cache_directory = directory)
+            weather.update_devices(devices)
+            weather.get_weather(devices)
+            self.provider.error_rate = 1
+            delays = []
+            for idx in range(2 * CIRCUIT_FAILURES):
+                del self.sent[:]
+                start = time.time()
+                weather.get_weather(devices)
+                delays.append(weather._scheduler.next_due() - start)
+                self.assertEqual(self.sent_temperatures(), [a_device['address'] for a_device in devices])
+            # 5 minutes (with a jitter), then doubled up to the maximum interval
+            self.assertTrue(150 <= delays[0] <= 450)
+            self.assertTrue(abs(delays[-1] - MAX_INTERVAL * 60) < 5)
+            metrics = weather.get_metrics()
+            self.assertEqual(metrics['scheduler']['failing'], len(devices))
+            self.assertEqual(metrics['scheduler']['circuits_open'], 0)
+            self.assertEqual(metrics['counters']['stale_sends'], 2 * CIRCUIT_FAILURES * len(devices))
+            # the provider is back
+            self.provider.error_rate = 0
+            weather.get_weather(devices)
+            self.assertEqual(weather.get_metrics()['scheduler']['failing'], 0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_invalid_location(self):
+        # only the circuit of the invalid location is opened, the other locations of its requests are sent
+        self.use_provider(invalid_woeids = ["1000001"])
+        devices = self.make_devices(3)
+        for batch_size in (1, 3):
+            weather = self.make_weather(batch_size = batch_size)
+            weather.update_devices(devices)
+            for idx in range(CIRCUIT_FAILURES):
+                del self.sent[:]
+                weather.get_weather(devices)
+                self.assertEqual(self.sent_temperatures(), ["1000000", "1000002"])
+            self.assertTrue(weather._scheduler.is_circuit_open("1000001"))
+            self.assertFalse(weather._scheduler.is_circuit_open("1000000"))
+            metrics = weather.get_metrics()
+            self.assertEqual(metrics['scheduler']['circuits_open'], 1)
+            self.assertEqual(metrics['counters']['circuits_opened'], 1)
+
+    def test_partial_batch(self):
+        # a location unknown to the provider is missing from the batch response : only it gets an error
+        self.use_provider(invalid_woeids = ["1000002"])
+        devices = self.make_devices(4)
+        weather = self.make_weather(batch_size = 4)
+        results = weather._fetch_chunk([(a_device, a_device['address']) for a_device in devices])
+        self.assertEqual([address for address, observation, error in results], ["1000000", "1000001", "1000002", "1000003"])
+        for address, observation, error in results:
+            if address == "1000002":
+                self.assertEqual(observation, None)
+                self.assertEqual(error, (u"No data returned by Yahoo weather for 1000002", True))
+            else:
+                self.assertEqual(error, None)
+                self.assertTrue(len(observation['current']) > 0)
+                self.assertEqual(len(observation['forecasts']), 5)
+        # the valid locations of the batch are sent, with a single request (the first one is the _fetch_chunk() call)
+        weather.update_devices(devices)
+        weather.get_weather(devices)
+        self.assertEqual(self.sent_temperatures(), ["1000000", "1000001", "1000003"])
+        self.assertEqual(weather.get_metrics()['counters']['http_status_200'], 2)
+
+    def test_sharded_messages(self):
+        # the worker processes only send back the extracted values : the messages must be the same
+        devices = self.make_devices(20)
+        self.make_weather().get_weather(devices)
+        local = self.sent[:]
+        del self.sent[:]
+        weather = self.make_weather(shards = 2)
+        weather.start_shards()
+        try:
+            weather.get_weather(devices)
+        finally:
+            weather.stop_shards()
+        # the sun elevation changes between the two polls
+        self.assertEqual(sorted(msg for msg in self.sent if msg[1] != "sun_elevation"),
+                         sorted(msg for msg in local if msg[1] != "sun_elevation"))
+        self.assertEqual(len([msg for msg in self.sent if msg[0] == "forecast"]), 5 * len(devices))
+
+    def test_sharded_records(self):
+        # each worker process records its responses in its own file
+        directory = tempfile.mkdtemp()
+        try:
+            record_filename = os.path.join(directory, "responses.rec")
+            devices = self.make_devices(20)
+            weather = self.make_weather(shards = 2, record_filename = record_filename)
+            weather.start_shards()
+            try:
+                weather.get_weather(devices)
+            finally:
+                weather.stop_shards()
+            filenames = [shard_record_filename(record_filename, shard) for shard in range(2)]
+            self.assertEqual(sorted(os.listdir(directory)), sorted(os.path.basename(filename) for filename in filenames))
+            recorded = [address for filename in filenames for timestamp, addresses, body in read_records(filename) for address in addresses]
+            self.assertEqual(sorted(recorded), sorted(a_device['address'] for a_device in devices))
+            # the files of the shards are replayed together
+            del self.sent[:]
+            self.assertEqual(self.make_weather().replay(filenames), 2)
+            self.assertEqual(len([msg for msg in self.sent if msg[0] == "forecast"]), 5 * len(devices))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()